@@ -3,13 +3,36 @@ import pyodbc
 import json
 import os
 import hashlib
-from datetime import datetime
+import base64
+from change_feed import ChangeNotifier
+from json_encoder import encode_json, FastJSONProvider
+from datetime_format import format_datetime, format_db_datetime, format_legacy_datetime
+from compression import compressor, COMPRESSION_ENABLED
+from metrics import registry as metrics_registry, MetricsMiddleware
+from query_stats import query_stats
+from ttl_cache import TTLCache
+import lao_numbers
+import datetime_format
 # remove these function to shared_utils
-from shared_utils import get_db_connection, token_required, generate_signature, \
-string_sort, generate_signature_apis, clean_string
+from shared_utils import get_db_connection, get_pool_stats, token_required, generate_signature, \
+string_sort, generate_signature_apis, clean_string, stream_requested, iter_cursor_rows, \
+stream_json_response, STREAM_FETCH_SIZE, execute_many, date_range_bounds, result_set_etag, etag_matches, \
+not_modified_response
 
 # Flask app
 app = Flask(__name__)
+# jsonify() and the Response(encode_json(...)) routes share one encoder
+app.json = FastJSONProvider(app)
+# gzip/deflate for clients that send Accept-Encoding (see compression.py)
+if COMPRESSION_ENABLED:
+    compressor.init_app(app)
+# Per-route latency, status, DB/serialization time and in-flight metrics (GET /metrics)
+MetricsMiddleware(app, metrics_registry)
+
+# Wakes /watchInvoices long polls when an order is uploaded or cancelled in this process.
+# The default cap keeps 2 of waitress' 4 default threads free for other requests;
+# raise it together with waitress --threads. Callers past the cap get 503 + Retry-After.
+invoice_changes = ChangeNotifier(max_waiters=int(os.getenv("LONGPOLL_MAX_WAITERS", "2")))
 
 # Define the decorator at the top
 #stored_token = os.getenv("BEARER_TOKEN")
@@ -91,91 +114,492 @@ def root():
 def ping():
     return jsonify({"status": "alive"}), 200
 
+def collect_component_stats():
+    """Connection pool, cache, long-poll and compression stats for /metrics."""
+    pool = get_pool_stats()
+    yield ("db_pool_connections", "gauge", "Pooled DB connections by state.",
+           [({"state": state}, pool[state]) for state in ("open", "idle", "checked_out")])
+    yield ("db_pool_max_connections", "gauge", "Maximum open DB connections.", [({}, pool["max_size"])])
+    yield ("db_pool_waiting_requests", "gauge", "Requests waiting for a free DB connection.", [({}, pool["waiting"])])
+    for key, help_text in (("created", "DB connections opened."), ("discarded", "DB connections closed by the pool."),
+                           ("checkouts", "DB connection checkouts."), ("timeouts", "Checkouts that timed out.")):
+        yield (f"db_pool_{key}_total", "counter", help_text, [({}, pool[key])])
+
+    caches = {**lao_numbers.cache_stats(), **datetime_format.cache_stats(),
+              "invoice_status": invoice_status_cache.stats(), "expense_status": expense_status_cache.stats()}
+    yield ("cache_hits_total", "counter", "Cache hits.",
+           [({"cache": name}, stats["hits"]) for name, stats in caches.items()])
+    yield ("cache_misses_total", "counter", "Cache misses.",
+           [({"cache": name}, stats["misses"]) for name, stats in caches.items()])
+    yield ("cache_entries", "gauge", "Entries held by each cache.",
+           [({"cache": name}, stats["size"]) for name, stats in caches.items()])
+    yield ("cache_bytes", "gauge", "Approximate size of size-bounded caches.",
+           [({"cache": name}, stats["bytes"]) for name, stats in caches.items() if "bytes" in stats])
+    yield ("cache_evictions_total", "counter", "Entries dropped to stay within a cache's limits.",
+           [({"cache": name}, stats["evictions"]) for name, stats in caches.items() if "evictions" in stats])
+
+    changes = invoice_changes.stats()
+    yield ("longpoll_waiters", "gauge", "Requests blocked in /watchInvoices.", [({}, changes["waiters"])])
+    yield ("longpoll_max_waiters", "gauge", "Limit on simultaneous /watchInvoices waiters.", [({}, changes["max_waiters"])])
+
+    compression = compressor.stats()["encodings"]
+    for key, help_text in (("responses", "Compressed responses."),
+                           ("bytes_in", "Response bytes before compression."),
+                           ("bytes_out", "Response bytes after compression.")):
+        yield (f"http_response_compression_{key}_total", "counter", help_text,
+               [({"encoding": encoding}, stats[key]) for encoding, stats in compression.items()])
+
+    # Statements are labelled by fingerprint id; /queryStats maps ids to SQL text
+    statements = query_stats.snapshot()["statements"]
+    yield ("db_statement_executions_total", "counter", "Executions per statement fingerprint.",
+           [({"statement": item["id"]}, item["count"]) for item in statements])
+    yield ("db_statement_errors_total", "counter", "Failed executions per statement fingerprint.",
+           [({"statement": item["id"]}, item["errors"]) for item in statements])
+    yield ("db_statement_execute_seconds_total", "counter", "Execute time per statement fingerprint.",
+           [({"statement": item["id"]}, item["execute_seconds"]) for item in statements])
+    yield ("db_statement_fetch_seconds_total", "counter", "Fetch time per statement fingerprint.",
+           [({"statement": item["id"]}, item["fetch_seconds"]) for item in statements])
+    yield ("db_statement_execute_quantile_seconds", "gauge",
+           "Execute time percentiles over recent executions per statement fingerprint.",
+           [({"statement": item["id"], "quantile": quantile}, item[key]) for item in statements
+            for quantile, key in (("0.5", "p50_seconds"), ("0.99", "p99_seconds"))])
+
+metrics_registry.add_collector(collect_component_stats)
+
+@app.route('/metrics', methods=['GET'])
+@token_required
+def metrics():
+    """Prometheus text exposition of the request metrics and component stats."""
+    return Response(metrics_registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8", status=200)
+
+@app.route('/queryStats', methods=['GET'])
+@token_required
+def get_query_stats():
+    """Per-statement execute counts, p50/p99 and fetch time, slowest first, with the normalised SQL."""
+    return jsonify(query_stats.snapshot()), 200
+
+@app.route('/compressionStats', methods=['GET'])
+@token_required
+def compression_stats():
+    """Response compression counters: bytes before/after and bytes saved, per encoding."""
+    return jsonify(compressor.stats()), 200
+
+def invoice_row_to_dict(parent):
+    """Map a TaxInv row to the /loadInvoices JSON shape (INV_DETAIL left empty)."""
+    return {
+        "INV_NO": parent.inv_no,
+        "SALE_CNT": parent.sale_cnt,
+        "SUPL_AMT": parent.supl_amt,
+        "VAT_AMT": parent.vat_amt,
+        "SALE_AMT": parent.sale_amt,
+        "SALE_AMT_WORD": parent.sale_amt_word,
+        "DISC_AMT":parent.disc_amt,
+        "CUST_TIN": parent.cust_tin,
+        "CUST_ID": parent.cust_id,
+        "CUST_FULL_NM": parent.cust_full_nm,
+        "CUST_ADDR": parent.cust_addr,
+        "CUST_TEL": parent.cust_tel,
+        "CUST_ACCNO": parent.cust_accno,
+        "CUST_ACCNAM": parent.cust_accnam,
+        "PAY_TYPE": parent.pay_type,
+        "ODER_NO": parent.order_no,
+        "STATUS": parent.status,
+        "FAIL_REASON": parent.fail_reason,
+        # /loadInvoices keeps the legacy stored-text date format ("Jan  2 2025  3:04PM")
+        "CREATE_DATE": format_legacy_datetime(parent.create_date),
+        "UPDATE_DATE": format_legacy_datetime(parent.update_date),
+        "ORDER_TYPE": parent.order_type,
+        "INV_DETAIL": []  # Placeholder for child records
+    }
+
+def invoice_detail_row_to_dict(child):
+    """Map a TaxInvDetail row to the INV_DETAIL JSON shape."""
+    return {
+        "INV_DT_ID": child.inv_dt_id,
+        "INV_NO": child.inv_no,
+        "PROD_CD": child.prod_cd,
+        "PROD_NM": child.prod_nm,
+        "SALE_CNT": child.sale_cnt,
+        "UNIT_SALE": child.unit_sale,
+        "UNIT_SALE_AMT": child.unit_sale_amt,
+        "VAT_AMT": child.vat_amt,
+        "SALE_AMT": child.sale_amt
+    }
+
+def fetch_invoice_details(cursor, parent_subquery, params=()):
+    """
+    Fetch the TaxInvDetail rows of every TaxInv row selected by parent_subquery
+    (a `SELECT inv_no FROM TaxInv ...` statement, or a `?, ?, ...` placeholder
+    list bound to inv_nos) in a single round trip, and return them grouped by
+    inv_no in database order.
+    """
+    cursor.execute(f"SELECT * FROM TaxInvDetail WHERE inv_no IN ({parent_subquery})", params)
+    details_by_inv_no = {}
+    for child in cursor.fetchall():
+        details_by_inv_no.setdefault(child.inv_no, []).append(invoice_detail_row_to_dict(child))
+    return details_by_inv_no
+
+# --- /loadInvoices pagination ---
+LOAD_INVOICES_DEFAULT_LIMIT = 100
+LOAD_INVOICES_MAX_LIMIT = 1000
+
+# Keyset seek on (create_date, order_no). The cursor carries the ORDER_NO of the
+# last row of the previous page; its create_date is looked up by primary key so
+# we never round-trip datetime values through the client.
+INVOICE_PAGE_FILTER = """
+    WHERE create_date > (SELECT create_date FROM TaxInv WHERE order_no = ?)
+       OR (create_date = (SELECT create_date FROM TaxInv WHERE order_no = ?) AND order_no > ?)
+"""
+
+def encode_page_cursor(order_no):
+    """Build the opaque next-page token for the row with the given ORDER_NO."""
+    raw = encode_json({"o": order_no})
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_page_cursor(token):
+    """Return the ORDER_NO encoded in a page token, or raise ValueError."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        order_no = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))["o"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(order_no, str) or not order_no:
+        raise ValueError("Invalid cursor")
+    return order_no
+
+def get_invoices_page(cursor, limit, page_cursor):
+    """Serve one keyset page of /loadInvoices."""
+    if page_cursor:
+        after_order_no = decode_page_cursor(page_cursor)
+        cursor.execute("SELECT 1 FROM TaxInv WHERE order_no = ?", (after_order_no,))
+        if not cursor.fetchone():
+            raise ValueError("Invalid cursor")
+        where_clause = INVOICE_PAGE_FILTER
+        seek_params = (after_order_no, after_order_no, after_order_no)
+    else:
+        where_clause = ""
+        seek_params = ()
+
+    # Fetch one extra row to know whether another page follows
+    parent_query = f"SELECT TOP (?) * FROM TaxInv {where_clause} ORDER BY create_date, order_no"
+    cursor.execute(parent_query, (limit + 1,) + seek_params)
+    parent_rows = cursor.fetchall()
+    has_more = len(parent_rows) > limit
+    parent_rows = parent_rows[:limit]
+
+    invoices = []
+    if parent_rows:
+        # Bind the page's own inv_nos so a row inserted between the two statements
+        # cannot shift the detail lookup onto a different set of invoices
+        page_inv_nos = list(dict.fromkeys(row.inv_no for row in parent_rows if row.inv_no is not None))
+        details_by_inv_no = {}
+        if page_inv_nos:
+            placeholders = ", ".join("?" * len(page_inv_nos))
+            details_by_inv_no = fetch_invoice_details(cursor, placeholders, page_inv_nos)
+        for parent in parent_rows:
+            invoice = invoice_row_to_dict(parent)
+            if parent.inv_no is not None:
+                invoice["INV_DETAIL"] = details_by_inv_no.get(parent.inv_no, [])
+            invoices.append(invoice)
+
+    return {
+        "code": "200",
+        "data": invoices,
+        "next_cursor": encode_page_cursor(parent_rows[-1].order_no) if has_more else None,
+        "message": "Invoices retrieved successfully"
+    }
+
+def iter_invoice_pages(cursor, page):
+    """Yield every invoice starting from page, fetching further keyset pages as needed."""
+    while True:
+        yield from page["data"]
+        if not page["next_cursor"]:
+            return
+        page = get_invoices_page(cursor, STREAM_FETCH_SIZE, page["next_cursor"])
+
 @app.route('/loadInvoices', methods=['GET'])
 @token_required  # Add this line to protect the route
 def get_invoices():
-    """Fetch invoices and their details from the database."""
+    """
+    Fetch invoices and their details from the database.
+
+    Passing `limit` and/or `cursor` switches to paginated mode: invoices are
+    returned in (create_date, order_no) order wrapped in an object with a
+    `next_cursor` token to pass back for the following page (null on the last one).
+    Passing `stream=1` without inv_no streams the full list page by page instead.
+    """
     inv_no = request.args.get('inv_no')  # Optional query parameter
+    limit_arg = request.args.get('limit')
+    page_cursor = request.args.get('cursor')
 
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
 
+        if not inv_no and (limit_arg is not None or page_cursor):
+            try:
+                limit = int(limit_arg) if limit_arg is not None else LOAD_INVOICES_DEFAULT_LIMIT
+            except ValueError:
+                limit = 0
+            if limit < 1 or limit > LOAD_INVOICES_MAX_LIMIT:
+                return Response(encode_json({"error": f"limit must be between 1 and {LOAD_INVOICES_MAX_LIMIT}"}),
+                                content_type="application/json; charset=utf-8", status=400)
+            try:
+                page = get_invoices_page(cursor, limit, page_cursor)
+            except ValueError as e:
+                return Response(encode_json({"error": str(e)}),
+                                content_type="application/json; charset=utf-8", status=400)
+            return Response(encode_json(page), content_type="application/json; charset=utf-8"), 200
+
+        if not inv_no and stream_requested():
+            page = get_invoices_page(cursor, STREAM_FETCH_SIZE, None)
+            if not page["data"]:
+                return Response(encode_json({"error": "No invoices found."}), 
+                                content_type="application/json; charset=utf-8", status=404)
+            response = stream_json_response(conn, iter_invoice_pages(cursor, page))
+            conn = None  # Closed by the streamed response once the body is sent
+            return response
+
         # Fetch parent records from TaxInv
         if inv_no:
             parent_query = "SELECT * FROM TaxInv WHERE inv_no = ?"
-            cursor.execute(parent_query, (inv_no,))
+            parent_subquery = "SELECT inv_no FROM TaxInv WHERE inv_no = ?"
+            params = (inv_no,)
         else:
             parent_query = "SELECT * FROM TaxInv"
-            cursor.execute(parent_query)
-
+            parent_subquery = "SELECT inv_no FROM TaxInv"
+            params = ()
+        cursor.execute(parent_query, params)
         parent_rows = cursor.fetchall()
 
         if not parent_rows:
-            return Response(json.dumps({"error": "No invoices found."}, ensure_ascii=False), 
+            return Response(encode_json({"error": "No invoices found."}), 
                             content_type="application/json; charset=utf-8", status=404)
 
-        invoices = []
+        # Fetch all child records from TaxInvDetail in one query instead of one per invoice
+        details_by_inv_no = fetch_invoice_details(cursor, parent_subquery, params)
 
+        invoices = []
         for parent in parent_rows:
-            # Map parent fields to a dictionary
-            invoice = {
-                "INV_NO": parent.inv_no,
-                "SALE_CNT": parent.sale_cnt,
-                "SUPL_AMT": parent.supl_amt,
-                "VAT_AMT": parent.vat_amt,
-                "SALE_AMT": parent.sale_amt,
-                "SALE_AMT_WORD": parent.sale_amt_word,
-                "DISC_AMT":parent.disc_amt,
-                "CUST_TIN": parent.cust_tin,
-                "CUST_ID": parent.cust_id,
-                "CUST_FULL_NM": parent.cust_full_nm,
-                "CUST_ADDR": parent.cust_addr,
-                "CUST_TEL": parent.cust_tel,
-                "CUST_ACCNO": parent.cust_accno,
-                "CUST_ACCNAM": parent.cust_accnam,
-                "PAY_TYPE": parent.pay_type,
-                "ODER_NO": parent.order_no,
-                "STATUS": parent.status,
-                "FAIL_REASON": parent.fail_reason,
-                "CREATE_DATE": parent.create_date,
-                "UPDATE_DATE": parent.update_date,
-                "ORDER_TYPE": parent.order_type,
-                "INV_DETAIL": []  # Placeholder for child records
-            }
-
-            # Fetch child records from TaxInvDetail
-            child_query = "SELECT * FROM TaxInvDetail WHERE inv_no = ?"
-            cursor.execute(child_query, (parent.inv_no,))
-            child_rows = cursor.fetchall()
-
-            for child in child_rows:
-                invoice["INV_DETAIL"].append({
-                    "INV_DT_ID": child.inv_dt_id,
-                    "INV_NO": child.inv_no,
-                    "PROD_CD": child.prod_cd,
-                    "PROD_NM": child.prod_nm,
-                    "SALE_CNT": child.sale_cnt,
-                    "UNIT_SALE": child.unit_sale,
-                    "UNIT_SALE_AMT": child.unit_sale_amt,
-                    "VAT_AMT": child.vat_amt,
-                    "SALE_AMT": child.sale_amt
-                })
-
+            invoice = invoice_row_to_dict(parent)
+            if parent.inv_no is not None:
+                invoice["INV_DETAIL"] = details_by_inv_no.get(parent.inv_no, [])
             invoices.append(invoice)
 
         # Return response as JSON without escaping non-ASCII characters
-        response_json = json.dumps(invoices, ensure_ascii=False)
+        response_json = encode_json(invoices)
         return Response(response_json, content_type="application/json; charset=utf-8"), 200
 
     except Exception as e:
-        response_json = json.dumps({"error": str(e)}, ensure_ascii=False)
+        response_json = encode_json({"error": str(e)})
         return Response(response_json, content_type="application/json; charset=utf-8"), 500
 
     finally:
         if 'conn' in locals() and conn:
             conn.close()
 
+def validate_invoice_upload(data):
+    """
+    Apply the /uploadInvoice rules to one signed order payload.
+    Returns (order_no, inv, None) when valid, or (None, None, error_body) otherwise.
+    """
+    # Validate required fields
+    required_fields = ["keyCode", "signDate", "ORDER_NO"]
+    missing_fields = [field for field in required_fields if field not in data]
+    if missing_fields:
+        return None, None, {"error": f"Missing required field(s): {', '.join(missing_fields)}"}
+
+    if data["keyCode"] != "VTI":
+        return None, None, {"error": "Invalid keyCode"}
+
+    # Extract fields from the request
+    key_code = data["keyCode"]
+    sign_date = data["signDate"]
+    order_no = data["ORDER_NO"]
+
+    client_signature = data.get("signature")
+
+    # Calculate the server's signature
+    server_signature = generate_signature(key_code, sign_date, order_no)
+
+    # Compare the client signature with the server's signature
+    if client_signature != server_signature:
+        return None, None, {"error": "Invalid signature"}
+
+    # Extract invoice object
+    inv = data.get("INV")
+    if not inv:
+        return None, None, {"error": "Missing 'INV' object in payload"}
+
+    # remove 6-1-25, invoice number will be update by apis, not upload by vti
+
+    # Extract ORDER_NO from the root of the JSON payload
+    order_no = clean_string(data["ORDER_NO"])  # Only fetch it once
+
+    validation_errors = invoice_field_errors(inv if isinstance(inv, dict) else {})
+
+    # If there are validation errors, report all issues at once
+    if validation_errors:
+        return None, None, {"error": validation_errors}
+
+    return order_no, inv, None
+
+# Allowed values for the INV fields (frozensets: checked on every upload)
+ALLOWED_ORDER_TYPES = frozenset(("insert", "update", "delete", "cancel"))
+ALLOWED_STATUSES = frozenset(("wait", "success", "fail", "cancel"))
+ALLOWED_PAYMENT_TYPES = frozenset(("cash", "transfer", "cheque"))
+# Exact types only: JSON numbers arrive as int or float, and bool is rejected
+NUMBER_TYPES = frozenset((int, float))
+
+def invoice_field_errors(inv):
+    """
+    Check the INV fields of an upload and return every error found (codes
+    10002-10015, in the order they have always been reported). Each field is
+    read once; amounts of the wrong type get their validation error rather
+    than a TypeError.
+    """
+    validation_errors = []
+
+    sale_cnt = inv.get("SALE_CNT")
+    supl_amt = inv.get("SUPL_AMT")
+    sale_amt = inv.get("SALE_AMT")
+    pay_type = inv.get("PAY_TYPE")
+    order_type = inv.get("ORDER_TYPE")
+    status = inv.get("STATUS")
+
+    # Required field validations
+    if not sale_cnt or type(sale_cnt) not in NUMBER_TYPES or sale_cnt <= 0:
+        validation_errors.append({"code": 10002, "message": "Sale count cannot be zero or null."})
+    if not supl_amt or type(supl_amt) not in NUMBER_TYPES or supl_amt <= 0:
+        validation_errors.append({"code": 10003, "message": "Supplier amount cannot be zero or null."})
+
+    # remove 5-1-2025, chinese says should allo 0, or blank
+    # if not inv.get("VAT_AMT") or inv.get("VAT_AMT") <= 0:
+    #     validation_errors.append({"code": 10004, "message": "VAT amount cannot be zero or null."})
+
+    if not sale_amt or type(sale_amt) not in NUMBER_TYPES or sale_amt <= 0:
+        validation_errors.append({"code": 10005, "message": "Sale amount cannot be zero or null."})
+    if not inv.get("CUST_FULL_NM"):
+        validation_errors.append({"code": 10006, "message": "Customer full name cannot be empty."})
+    if not pay_type:
+        validation_errors.append({"code": 10007, "message": "Payment type cannot be empty."})
+    if not order_type:
+        validation_errors.append({"code": 10009, "message": "Order type cannot be empty."})
+    if not inv.get("CUST_ID"):
+        validation_errors.append({"code": 10004, "message": "Custmoer ID cannot be empty."})
+
+    # Validation rules for allowed values. Status is assigned directly as "wait" so no
+    # validation is needed, but it is still checked in case we later allow it freely
+    if order_type and (type(order_type) is not str or order_type not in ALLOWED_ORDER_TYPES):
+        validation_errors.append({"code": 10010, "message": "Order type must be one of insert, update, delete, cancel."})
+    if status and (type(status) is not str or status not in ALLOWED_STATUSES):
+        validation_errors.append({"code": 10011, "message": "Status must be one of wait, success, fail, cancel."})
+    if pay_type and (type(pay_type) is not str or pay_type not in ALLOWED_PAYMENT_TYPES):
+        validation_errors.append({"code": 10012, "message": "Payment type must be one of cash, transfer, cheque."})
+
+    # Extract PAY_DIFF_CLEAR and PAY_DIFF_CON
+    pay_diff_clear = inv.get("PAY_DIFF_CLEAR", 0)
+    pay_diff_con = inv.get("PAY_DIFF_CON", 0)
+
+    # Validate PAY_DIFF_CLEAR (must be between -20000 and 20000)
+    if pay_diff_clear is not None and (type(pay_diff_clear) not in NUMBER_TYPES
+                                       or pay_diff_clear < -20000 or pay_diff_clear > 20000):
+        validation_errors.append({"code": 10013, "message": "PAY_DIFF_CLEAR must be between -20000 and 20000."})
+
+    # Validate PAY_DIFF_CON (if not zero, must be < -20000 or > 20000)
+    if pay_diff_con is not None and pay_diff_con != 0 and (type(pay_diff_con) not in NUMBER_TYPES
+                                                           or -20000 <= pay_diff_con <= 20000):
+        validation_errors.append({"code": 10014, "message": "PAY_DIFF_CON must be either less than -20000 or greater than 20000."})
+
+    # Ensure PAY_DIFF_CLEAR and PAY_DIFF_CON are not both nonzero at the same time
+    if pay_diff_clear is not None and pay_diff_clear != 0 and pay_diff_con is not None and pay_diff_con != 0:
+        validation_errors.append({"code": 10015, "message": "PAY_DIFF_CLEAR and PAY_DIFF_CON cannot both be nonzero at the same time."})
+
+    return validation_errors
+
+def sale_amount_to_words(amount):
+    """
+    Lao words for SALE_AMT, stored with the invoice so clients no longer need a
+    separate /number-to-words call. Whole amounts are read without a decimal
+    part (4000.0 -> "ສີ່ພັນ"); string amounts are read exactly as sent, like
+    /number-to-words does. Returns None when the amount cannot be read.
+    """
+    if isinstance(amount, float) and amount.is_integer():
+        amount = int(amount)
+    _, words, error = convert_number_value(amount)
+    return None if error else words
+
+def insert_invoice(cursor, order_no, inv):
+    """
+    Insert one validated invoice (Taxinv row plus its TaxinvDetail lines) without committing.
+    Returns the server-generated CREATE_DATE and UPDATE_DATE, formatted for the API.
+    """
+    inv_status = "wait"
+    pay_diff_clear = inv.get("PAY_DIFF_CLEAR", 0)
+    pay_diff_con = inv.get("PAY_DIFF_CON", 0)
+
+    # Insert into the parent table with update_date set to the same as create_date.
+    # OUTPUT hands back the server timestamps as native datetimes in the same round trip.
+    taxinv_query = """
+        INSERT INTO Taxinv (sale_cnt, supl_amt, fee_amt, vat_amt, rvpf_amt, sale_amt, disc_amt, cust_tin, cust_id, cust_full_nm, 
+                            cust_addr, cust_tel, bank_name, cust_accno, cust_accnam, pay_type, bill_type, pay_bank, agency_fee, 
+                            received_amt, order_no, status, 
+                            create_date, update_date, order_type, pay_diff_clear, pay_diff_con, sale_amt_word)
+        OUTPUT INSERTED.create_date, INSERTED.update_date
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,  GETDATE(), GETDATE(), ?, ?, ?, ?)
+    """
+    taxinv_params = (
+        inv["SALE_CNT"], inv["SUPL_AMT"], inv["FEE_AMT"], inv["VAT_AMT"], inv.get("RVPF_AMT", 0), inv["SALE_AMT"], inv.get("DISC_AMT", 0),
+        clean_string(inv.get("CUST_TIN")), clean_string(inv.get("CUST_ID")), clean_string(inv.get("CUST_FULL_NM")), clean_string(inv.get("CUST_ADDR")), clean_string(inv.get("CUST_TEL")), clean_string(inv.get("BANK_NAME")),
+        clean_string(inv.get("CUST_ACCNO")), clean_string(inv.get("CUST_ACCNAM")), clean_string(inv.get("PAY_TYPE")), clean_string(inv.get("BILL_TYPE")), clean_string(inv.get("PAY_BANK")), inv.get("AGENCY_FEE"), 
+        inv.get("RECEIVED_AMT"), order_no, inv_status,  clean_string(inv.get("ORDER_TYPE")), pay_diff_clear, pay_diff_con,
+        sale_amount_to_words(inv["SALE_AMT"])
+    )
+
+    cursor.execute(taxinv_query, taxinv_params)
+    inserted = cursor.fetchone()
+    if not inserted:
+        raise Exception("Failed to retrieve timestamps for the inserted order.")
+
+    # Insert into the child table
+    inv_detail_query = """
+        INSERT INTO TaxinvDetail (order_no, prod_cd, prod_nm, sale_cnt, 
+                                  unit_sale, unit_sale_amt, vat_amt, sale_amt)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    inv_detail_params = [
+        (
+            order_no,  # Use the order_no extracted from the INV object
+            clean_string(detail["PROD_CD"]),
+            clean_string(detail["PROD_NM"]), detail["SALE_CNT"], clean_string(detail["UNIT_SALE"]),
+            detail["UNIT_SALE_AMT"], detail["VAT_AMT"], detail["SALE_AMT"]
+        )
+        for detail in inv["INV_DETAIL"]
+    ]
+    # Send all detail lines in one round trip
+    execute_many(cursor, inv_detail_query, inv_detail_params)
+
+    # Format the timestamps returned by the INSERT
+    return (
+        format_db_datetime(inserted.create_date),
+        format_db_datetime(inserted.update_date)
+    )
+
+def invoice_integrity_error(e):
+    """Map a pyodbc.IntegrityError raised while inserting an invoice to the API error object."""
+    # Handle database integrity errors for duplicates
+    error_message = str(e).lower()
+    if "order_no" in error_message:
+        error_code = 20001
+        user_message = "Duplicate ORDER_NO detected."
+    # elif "inv_no" in error_message:
+    #     error_code = 20002
+    #     user_message = "Duplicate INV_NO detected."
+    else:
+        error_code = 20000
+        user_message = "Database integrity error (Possible duplicated ORDER_NO)"
+    return {"code": error_code, "message": user_message}
+
 @app.route('/uploadInvoice', methods=['POST'])
 @token_required  # Add this line to protect the route
 def upload_invoice():
@@ -185,290 +609,243 @@ def upload_invoice():
         data = request.get_json()
         if not data:
             return Response(
-                json.dumps({"error": "Invalid JSON input"}, ensure_ascii=False),
+                encode_json({"error": "Invalid JSON input"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
 
-        # Validate required fields
-        required_fields = ["keyCode", "signDate", "ORDER_NO"]
-        missing_fields = [field for field in required_fields if field not in data]
-        if missing_fields:
+        order_no, inv, error = validate_invoice_upload(data)
+        if error:
             return Response(
-                json.dumps({"error": f"Missing required field(s): {', '.join(missing_fields)}"}, ensure_ascii=False),
+                encode_json(error),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
 
-        if data["keyCode"] != "VTI":
-            return Response(
-                json.dumps({"error": "Invalid keyCode"}, ensure_ascii=False),
-                content_type="application/json; charset=utf-8",
-                status=400
-            )
+        # Connect to the database
+        conn = get_db_connection()
+        cursor = conn.cursor()
 
+        create_date, update_date = insert_invoice(cursor, order_no, inv)
 
-        # Extract fields from the request
-        key_code = data["keyCode"]
-        sign_date = data["signDate"]
-        order_no = data["ORDER_NO"]
+        # Commit the transaction
+        conn.commit()
+        invoice_changes.notify()
 
-        client_signature = data["signature"]
+        # Include timestamps in the response
+        return Response(
+            encode_json({
+                "code": "200",
+                "data": {
+                    "ORDER_NO": order_no,
+                    "CREATE_DATE": create_date,
+                    "UPDATE_DATE": update_date
+                },
+                "message": "Order uploaded successfully"
+            }),
+            content_type="application/json; charset=utf-8",
+            status=200
+        )
 
-        # Generate the string to sign
-        string_to_sign = f"{key_code}{sign_date}{order_no}"
+    except pyodbc.IntegrityError as e:
+        return Response(
+            encode_json({"error": invoice_integrity_error(e)}),
+            content_type="application/json; charset=utf-8",
+            status=400
+        )
 
-        # Calculate the server's signature using HMAC
-        server_signature = generate_signature(key_code, sign_date, order_no)
+    except Exception as e:
+        # Handle errors
+        return Response(
+            encode_json({"error": str(e)}),
+            content_type="application/json; charset=utf-8",
+            status=500
+        )
 
+    finally:
+        if 'conn' in locals() and conn:
+            conn.close()
 
-        # Compare the client signature with the server's signature
-        if client_signature != server_signature:
+# --- Bulk upload ---
+UPLOAD_BATCH_MAX_ORDERS = int(os.getenv("UPLOAD_BATCH_MAX_ORDERS", "1000"))
+UPLOAD_BATCH_MODES = ["atomic", "per_item"]
+
+def rollback_upload_item(cursor):
+    """
+    Undo the failed order back to the upload_item savepoint. Returns False when
+    that is impossible because the error doomed (XACT_STATE() = -1) or already
+    ended (0) the whole transaction, e.g. a conversion error or a deadlock.
+    """
+    try:
+        if cursor.execute("SELECT XACT_STATE()").fetchone()[0] != 1:
+            return False
+        cursor.execute("ROLLBACK TRANSACTION upload_item")
+        return True
+    except pyodbc.Error:
+        return False
+
+def batch_rolled_back_response(results, valid, message, status=400, error=None):
+    """
+    Report an abandoned batch: orders already inserted are marked rolled back and
+    orders not reached yet as not attempted; orders that failed keep their error.
+    """
+    for index, order_no, _ in valid:
+        if results[index] is None:
+            results[index] = {"ORDER_NO": order_no, "code": "409", "error": f"Not attempted: {message}"}
+        elif results[index]["code"] == "200":
+            results[index] = {"ORDER_NO": order_no, "code": "409", "error": f"Rolled back: {message}"}
+    body = {"code": str(status), "data": results, "message": "Batch rolled back; no orders were uploaded"}
+    if error is not None:
+        body["error"] = error
+    return Response(encode_json(body), content_type="application/json; charset=utf-8", status=status)
+
+@app.route('/uploadInvoices', methods=['POST'])
+@token_required
+def upload_invoices():
+    """
+    Insert many invoices in one request.
+
+    Body: {"ORDERS": [<signed /uploadInvoice payload>, ...], "MODE": "atomic" | "per_item"}
+
+    Every order is validated with the /uploadInvoice rules before anything is written.
+    - atomic (default): all orders are inserted in one transaction; any invalid or
+      failing order rolls back the whole batch.
+    - per_item: valid orders are inserted in one transaction with a savepoint per
+      order, so a failing order is rolled back on its own and the rest are kept.
+      An error that dooms the whole transaction (conversion error, deadlock) rolls
+      back every order; the rest are then reported as not attempted.
+    The response lists one result per order, in request order. A failed commit is
+    reported for the batch (500), not charged to any one order.
+    """
+    try:
+        payload = request.get_json()
+        if not payload:
             return Response(
-                json.dumps({"error": "Invalid signature"}, ensure_ascii=False),
+                encode_json({"error": "Invalid JSON input"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
 
-        # Verify if the client's signature matches the server's signature
-        #if not hmac.compare_digest(server_signature, client_signature):
-        #    return Response(
-        #        json.dumps({"error": "Invalid signature"}, ensure_ascii=False),
-        #        content_type="application/json; charset=utf-8",
-        #        status=400
-        #    )
+        orders = payload.get("ORDERS")
+        mode = payload.get("MODE", "atomic")
 
-        # Extract invoice object
-        inv = data.get("INV")
-        if not inv:
+        if not isinstance(orders, list) or not orders:
             return Response(
-                json.dumps({"error": "Missing 'INV' object in payload"}, ensure_ascii=False),
+                encode_json({"error": "Missing or empty 'ORDERS' array"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
-
-        # remove 6-1-25, invoice number will be update by apis, not upload by vti
-        # inv_no = inv.get("INV_NO")
-        # if not inv_no:
-        #     return Response(
-        #         json.dumps({"error": "Missing 'INV_NO' in 'INV' object"}, ensure_ascii=False),
-        #         content_type="application/json; charset=utf-8",
-        #         status=400
-        #     )
-
-        # Extract ORDER_NO from the root of the JSON payload
-        order_no = clean_string(data["ORDER_NO"])  # Only fetch it once
-
-        if not inv:
+        if len(orders) > UPLOAD_BATCH_MAX_ORDERS:
             return Response(
-                json.dumps({"error": "Missing 'INV' object in payload"}, ensure_ascii=False),
+                encode_json({"error": f"Too many orders in one batch (maximum {UPLOAD_BATCH_MAX_ORDERS})"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
-
-         # Insert defaults for missing dates
-        inv_status = "wait"
-        create_date = None  # Placeholder for database GETDATE()
-        update_date = None  # Leave as NULL
-
-
-        validation_errors = []
-        
-        # Required field validations
-        # if not inv.get("INV_NO"):
-            # validation_errors.append({"code": 10001, "message": "Invoice number cannot be empty."})
-        if not inv.get("SALE_CNT") or inv.get("SALE_CNT") <= 0:
-            validation_errors.append({"code": 10002, "message": "Sale count cannot be zero or null."})
-        if not inv.get("SUPL_AMT") or inv.get("SUPL_AMT") <= 0:
-            validation_errors.append({"code": 10003, "message": "Supplier amount cannot be zero or null."})
-
-        # remove 5-1-2025, chinese says should allo 0, or blank
-        # if not inv.get("VAT_AMT") or inv.get("VAT_AMT") <= 0:
-        #     validation_errors.append({"code": 10004, "message": "VAT amount cannot be zero or null."})
-
-        if not inv.get("SALE_AMT") or inv.get("SALE_AMT") <= 0:
-            validation_errors.append({"code": 10005, "message": "Sale amount cannot be zero or null."})
-        if not inv.get("CUST_FULL_NM"):
-            validation_errors.append({"code": 10006, "message": "Customer full name cannot be empty."})
-        if not inv.get("PAY_TYPE"):
-            validation_errors.append({"code": 10007, "message": "Payment type cannot be empty."})
-        #if not inv.get("CREATE_DATE"):
-        #    validation_errors.append({"code": 10008, "message": "Create date cannot be empty."})
-        if not inv.get("ORDER_TYPE"):
-            validation_errors.append({"code": 10009, "message": "Order type cannot be empty."})
-        if not inv.get("CUST_ID"):
-            validation_errors.append({"code": 10004, "message": "Custmoer ID cannot be empty."})
-
-
-        # Validation rules for required fields and allowed values
-        allowed_order_types = ["insert", "update", "delete", "cancel"]
-        allowed_status = ["wait", "success", "fail","cancel"]
-        allowed_payment_types = ["cash", "transfer", "cheque"]
-
-        if inv.get("ORDER_TYPE") and inv["ORDER_TYPE"] not in allowed_order_types:
-            validation_errors.append({"code": 10010, "message": f"Order type must be one of {', '.join(allowed_order_types)}."})
-        if inv.get("STATUS") and inv["STATUS"] not in allowed_status:
-            validation_errors.append({"code": 10011, "message": f"Status must be one of {', '.join(allowed_status)}."})
-        if inv.get("PAY_TYPE") and inv["PAY_TYPE"] not in allowed_payment_types:
-            validation_errors.append({"code": 10012, "message": f"Payment type must be one of {', '.join(allowed_payment_types)}."})
-       
-        # Extract PAY_DIFF_CLEAR and PAY_DIFF_CON
-        pay_diff_clear = inv.get("PAY_DIFF_CLEAR", 0)
-        pay_diff_con = inv.get("PAY_DIFF_CON", 0)
-
-        # Validate PAY_DIFF_CLEAR (must be between -20000 and 20000)
-        if pay_diff_clear is not None and (pay_diff_clear < -20000 or pay_diff_clear > 20000):
-            validation_errors.append({"code": 10013, "message": "PAY_DIFF_CLEAR must be between -20000 and 20000."})
-
-        # Validate PAY_DIFF_CON (if not zero, must be < -20000 or > 20000)
-        if pay_diff_con not in (0, None) and not (pay_diff_con < -20000 or pay_diff_con > 20000):
-            validation_errors.append({"code": 10014, "message": "PAY_DIFF_CON must be either less than -20000 or greater than 20000."})
-
-        # Ensure PAY_DIFF_CLEAR and PAY_DIFF_CON are not both nonzero at the same time
-        if pay_diff_clear not in (0, None) and pay_diff_con not in (0, None):
-            validation_errors.append({"code": 10015, "message": "PAY_DIFF_CLEAR and PAY_DIFF_CON cannot both be nonzero at the same time."})
-
-        # Status is assigned directly as "wait" so no validation is needed, but still I put it , may be we 
-        # we will modify for further to freely input status
-
-        # If there are validation errors, return a 400 response with all issues
-        if validation_errors:
-            return Response(
-                json.dumps({"error": validation_errors}, ensure_ascii=False),
+        if mode not in UPLOAD_BATCH_MODES:
+            return Response(
+                encode_json({"error": f"MODE must be one of {', '.join(UPLOAD_BATCH_MODES)}"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
 
-        # Connect to the database
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Insert into the parent table with update_date set to the same as create_date
-        taxinv_query = """
-            INSERT INTO Taxinv (sale_cnt, supl_amt, fee_amt, vat_amt, rvpf_amt, sale_amt, disc_amt, cust_tin, cust_id, cust_full_nm, 
-                                cust_addr, cust_tel, bank_name, cust_accno, cust_accnam, pay_type, bill_type, pay_bank, agency_fee, 
-                                received_amt, order_no, status, 
-                                create_date, update_date, order_type, pay_diff_clear, pay_diff_con)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,  GETDATE(), GETDATE(), ?, ?, ?)
-        """
-        taxinv_params = (
-            inv["SALE_CNT"], inv["SUPL_AMT"], inv["FEE_AMT"], inv["VAT_AMT"], inv.get("RVPF_AMT", 0), inv["SALE_AMT"], inv.get("DISC_AMT", 0),
-            clean_string(inv.get("CUST_TIN")), clean_string(inv.get("CUST_ID")), clean_string(inv.get("CUST_FULL_NM")), clean_string(inv.get("CUST_ADDR")), clean_string(inv.get("CUST_TEL")), clean_string(inv.get("BANK_NAME")),
-            clean_string(inv.get("CUST_ACCNO")), clean_string(inv.get("CUST_ACCNAM")), clean_string(inv.get("PAY_TYPE")), clean_string(inv.get("BILL_TYPE")), clean_string(inv.get("PAY_BANK")), inv.get("AGENCY_FEE"), 
-            inv.get("RECEIVED_AMT"), order_no, inv_status,  clean_string(inv.get("ORDER_TYPE")), pay_diff_clear, pay_diff_con
-        )
-
-        cursor.execute(taxinv_query, taxinv_params)
-
-        # Insert into the child table
-        inv_detail_query = """
-            INSERT INTO TaxinvDetail (order_no, prod_cd, prod_nm, sale_cnt, 
-                                      unit_sale, unit_sale_amt, vat_amt, sale_amt)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        for detail in inv["INV_DETAIL"]:
-            inv_detail_params = (
-                order_no,  # Use the order_no extracted from the INV object
-                clean_string(detail["PROD_CD"]),
-                clean_string(detail["PROD_NM"]), detail["SALE_CNT"], clean_string(detail["UNIT_SALE"]),
-                detail["UNIT_SALE_AMT"], detail["VAT_AMT"], detail["SALE_AMT"]
+        # Validate every order up front with the single-upload rules
+        results = []
+        valid = []  # (index, order_no, inv)
+        seen_order_nos = set()
+        for index, order in enumerate(orders):
+            order_no = order.get("ORDER_NO") if isinstance(order, dict) else None
+            try:
+                if not isinstance(order, dict):
+                    raise ValueError("Each order must be a JSON object")
+                order_no, inv, error = validate_invoice_upload(order)
+            except Exception as e:
+                order_no, inv, error = order_no, None, {"error": str(e)}
+            if not error and order_no in seen_order_nos:
+                error = {"error": {"code": 20001, "message": "Duplicate ORDER_NO detected."}}
+            if error:
+                results.append({"ORDER_NO": order_no, "code": "400", **error})
+            else:
+                seen_order_nos.add(order_no)
+                results.append(None)
+                valid.append((index, order_no, inv))
+
+        if mode == "atomic" and len(valid) < len(orders):
+            for index, order_no, _ in valid:
+                results[index] = {"ORDER_NO": order_no, "code": "409", "error": "Not inserted: another order in the batch is invalid"}
+            return Response(
+                encode_json({"code": "400", "data": results, "message": "Batch rejected; no orders were uploaded"}),
+                content_type="application/json; charset=utf-8",
+                status=400
             )
-            cursor.execute(inv_detail_query, inv_detail_params)
-
-        # Commit the transaction
-        conn.commit()
-
-        
-        # Fetch the CREATE_DATE and UPDATE_DATE after the insert
-        fetch_query = """
-            SELECT create_date, update_date FROM Taxinv WHERE order_no = ?
-        """
-        cursor.execute(fetch_query, (order_no,))
-        result = cursor.fetchone()
-
-        # Convert SQL Server default datetime format to the desired format
-        if result:
-            create_date = datetime.strptime(str(result[0]), "%b %d %Y %I:%M%p").strftime("%d/%m/%Y %H:%M:%S")
-            update_date = datetime.strptime(str(result[1]), "%b %d %Y %I:%M%p").strftime("%d/%m/%Y %H:%M:%S")
-        else:
-            raise Exception("Failed to retrieve timestamps for the inserted order.")
-       
 
-        # Include timestamps in the response
+        if valid:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+
+            if mode == "atomic":
+                current = None
+                try:
+                    for index, order_no, inv in valid:
+                        current = index
+                        create_date, update_date = insert_invoice(cursor, order_no, inv)
+                        results[index] = {"ORDER_NO": order_no, "code": "200", "CREATE_DATE": create_date, "UPDATE_DATE": update_date}
+                except Exception as e:
+                    conn.rollback()
+                    for index, order_no, _ in valid:
+                        if index == current:
+                            error = invoice_integrity_error(e) if isinstance(e, pyodbc.IntegrityError) else str(e)
+                            results[index] = {"ORDER_NO": order_no, "code": "400", "error": error}
+                        else:
+                            results[index] = {"ORDER_NO": order_no, "code": "409", "error": "Not inserted: another order in the batch failed"}
+                    return Response(
+                        encode_json({"code": "400", "data": results, "message": "Batch rejected; no orders were uploaded"}),
+                        content_type="application/json; charset=utf-8",
+                        status=400
+                    )
+            else:
+                # One transaction, one savepoint per order. SAVE TRANSACTION needs an open
+                # transaction; in pyodbc's manual-commit mode the driver opens one implicitly
+                # on the first statement that reads a table (an explicit BEGIN TRANSACTION
+                # would nest and survive conn.commit()).
+                cursor.execute("SELECT TOP (0) order_no FROM TaxInv").fetchall()
+                for index, order_no, inv in valid:
+                    cursor.execute("SAVE TRANSACTION upload_item")
+                    try:
+                        create_date, update_date = insert_invoice(cursor, order_no, inv)
+                        results[index] = {"ORDER_NO": order_no, "code": "200", "CREATE_DATE": create_date, "UPDATE_DATE": update_date}
+                    except Exception as e:
+                        error = invoice_integrity_error(e) if isinstance(e, pyodbc.IntegrityError) else str(e)
+                        results[index] = {"ORDER_NO": order_no, "code": "400", "error": error}
+                        if not rollback_upload_item(cursor):
+                            conn.rollback()
+                            return batch_rolled_back_response(
+                                results, valid, f"order {order_no} failed and the batch transaction was rolled back")
+
+            try:
+                conn.commit()
+            except Exception as e:
+                try:
+                    conn.rollback()
+                except pyodbc.Error:
+                    pass
+                return batch_rolled_back_response(results, valid, "the batch commit failed", status=500, error=str(e))
+            invoice_changes.notify()
+
+        uploaded = sum(1 for result in results if result["code"] == "200")
         return Response(
-            json.dumps({
+            encode_json({
                 "code": "200",
-                "data": {
-                    "ORDER_NO": order_no,
-                    "CREATE_DATE": create_date,
-                    "UPDATE_DATE": update_date
-                },
-                "message": "Order uploaded successfully"
-            }, ensure_ascii=False),
+                "data": results,
+                "message": f"{uploaded} of {len(orders)} orders uploaded successfully"
+            }),
             content_type="application/json; charset=utf-8",
             status=200
         )
-# Return success response with the specified structure
-        # return Response(
-        #     json.dumps({
-        #         "code": "200",
-        #         "data": {
-        #             "ORDER_NO": order_no,
-                
-        #         },
-        #         "message": "Order uploaded successfully"
-        #     }, ensure_ascii=False),
-        #     content_type="application/json; charset=utf-8",
-        #     status=200
-        # )
-        
-    # except pyodbc.IntegrityError as e:
-    # # Handle database integrity errors for duplicates
-    #     if "duplicate key" in str(e).lower():
-    #         if "order_no" in str(e).lower():
-    #             error_code = 20001
-    #             error_message = "Duplicate ORDER_NO detected."
-    #         elif "inv_no" in str(e).lower():
-    #             error_code = 20002
-    #             error_message = "Duplicate INV_NO detected."
-    #         else:
-    #             error_code = 20000
-    #             error_message = "Database integrity error."
-            
-    #         return Response(
-    #             json.dumps({"error": {"code": error_code, "message": error_message}}, ensure_ascii=False),
-    #             content_type="application/json; charset=utf-8",
-    #             status=400
-    #         )
-
-    except pyodbc.IntegrityError as e:
-        # Handle database integrity errors for duplicates
-        error_message = str(e).lower()
-        if "order_no" in error_message:
-            error_code = 20001
-            user_message = "Duplicate ORDER_NO detected."
-        # elif "inv_no" in error_message:
-        #     error_code = 20002
-        #     user_message = "Duplicate INV_NO detected."
-        else:
-            error_code = 20000
-            user_message = "Database integrity error (Possible duplicated ORDER_NO)"
-
-        return Response(
-            json.dumps({
-                "error": {
-                    "code": error_code,
-                    "message": user_message
-                }
-            }, ensure_ascii=False),
-            content_type="application/json; charset=utf-8",
-            status=400
-        )
 
     except Exception as e:
         # Handle errors
         return Response(
-            json.dumps({"error": str(e)}, ensure_ascii=False),
+            encode_json({"error": str(e)}),
             content_type="application/json; charset=utf-8",
             status=500
         )
@@ -478,6 +855,44 @@ def upload_invoice():
             conn.close()
 
 
+# --- Terminal status cache ---
+# Orders in a final state are re-queried by clients long after they stop changing.
+# Their /getInvoiceStatus(es) objects are cached in-process, keyed like the column
+# collation compares (case and trailing spaces ignored). Writes in this process
+# invalidate the entry; STATUS_CACHE_TTL bounds staleness from other writers.
+TERMINAL_INVOICE_STATUSES = frozenset(("success", "fail", "cancel"))
+
+invoice_status_cache = TTLCache(
+    max_entries=int(os.getenv("STATUS_CACHE_MAX_ENTRIES", "10000")),
+    max_bytes=int(os.getenv("STATUS_CACHE_MAX_BYTES", str(4 * 1024 * 1024))),
+    ttl=float(os.getenv("STATUS_CACHE_TTL", "300")),
+    sizeof=lambda value: len(encode_json(value)),
+)
+
+def status_cache_key(order_no):
+    """
+    Key an ORDER_NO the way the column collation compares it: case and trailing
+    spaces are ignored, leading spaces are not (' A1' is a different order).
+    """
+    return order_no.rstrip().casefold()
+
+def cache_terminal_status(status, generation):
+    """Cache a /getInvoiceStatus object if the order has reached a final status."""
+    if status["STATUS"] in TERMINAL_INVOICE_STATUSES:
+        invoice_status_cache.put(status_cache_key(status["ORDER_NO"]), status, generation)
+
+def invoice_status_to_dict(invoice):
+    """Map a TaxInv status row to the /getInvoiceStatus JSON shape."""
+    return {
+        "ORDER_NO": invoice.order_no,
+        "INV_NO": invoice.inv_no,
+        "STATUS": invoice.status,
+        "ORDER_TYPE": invoice.order_type,
+        "SALE_AMT_WORD": invoice.sale_amt_word,
+        "FAIL_REASON": invoice.fail_reason or "",
+        "UPDATE_DATE": format_db_datetime(invoice.update_date)
+    }
+
 @app.route('/getInvoiceStatus', methods=['POST'])
 @token_required  # Add this line to protect the route
 def get_invoice_status():
@@ -487,7 +902,7 @@ def get_invoice_status():
         data = request.get_json()
         if not data:
             return Response(
-                json.dumps({"error": "Invalid JSON input"}, ensure_ascii=False),
+                encode_json({"error": "Invalid JSON input"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -502,7 +917,7 @@ def get_invoice_status():
         # Validate required parameters
         if not all([order_no, key_code, sign_date, client_signature]):
             return Response(
-                json.dumps({"error": "Missing required parameters: ORDER_NO, keyCode, signDate, or sign"}, ensure_ascii=False),
+                encode_json({"error": "Missing required parameters: ORDER_NO, keyCode, signDate, or sign"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -510,7 +925,7 @@ def get_invoice_status():
         # Validate keyCode
         if key_code != "VTI":
             return Response(
-                json.dumps({"error": "Invalid keyCode"}, ensure_ascii=False),
+                encode_json({"error": "Invalid keyCode"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -521,11 +936,22 @@ def get_invoice_status():
         # Compare client signature with server signature
         if client_signature != server_signature:
             return Response(
-                json.dumps({"error": "Invalid signature"}, ensure_ascii=False),
+                encode_json({"error": "Invalid signature"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
 
+        # Final statuses are served from the cache without touching the database
+        result = invoice_status_cache.get(status_cache_key(order_no))
+        if result is not None:
+            response_json = encode_json({
+                "code": "200",
+                "data": result,
+                "message": "Invoice status retrieved successfully"
+            })
+            return Response(response_json, content_type="application/json; charset=utf-8", status=200)
+        cache_generation = invoice_status_cache.generation
+
         # Connect to the database
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -541,35 +967,152 @@ def get_invoice_status():
 
         if not invoice:
             return Response(
-                json.dumps({"error": "No invoice found for the provided ORDER_NO."}, ensure_ascii=False),
+                encode_json({"error": "No invoice found for the provided ORDER_NO."}),
                 content_type="application/json; charset=utf-8",
                 status=404
             )
 
-        formated_update_date = datetime.strptime(invoice.update_date, "%b %d %Y %I:%M%p").strftime("%d/%m/%Y %H:%M:%S")
-        
         # Map query result to a dictionary
-        result = {
-            "ORDER_NO": invoice.order_no,
-            "INV_NO": invoice.inv_no,
-            "STATUS": invoice.status,
-            "ORDER_TYPE": invoice.order_type,
-            "SALE_AMT_WORD": invoice.sale_amt_word,
-            "FAIL_REASON": invoice.fail_reason or "",
-            "UPDATE_DATE": formated_update_date
-        }
+        result = invoice_status_to_dict(invoice)
+        cache_terminal_status(result, cache_generation)
 
         # Return the response
-        response_json = json.dumps({
+        response_json = encode_json({
             "code": "200",
             "data": result,
             "message": "Invoice status retrieved successfully"
-        }, ensure_ascii=False)
+        })
+        return Response(response_json, content_type="application/json; charset=utf-8", status=200)
+
+    except Exception as e:
+        # Handle errors
+        response_json = encode_json({"error": str(e)})
+        return Response(response_json, content_type="application/json; charset=utf-8", status=500)
+
+    finally:
+        if 'conn' in locals() and conn:
+            conn.close()
+
+
+# --- Batch status lookup ---
+STATUS_BATCH_MAX_ORDERS = int(os.getenv("STATUS_BATCH_MAX_ORDERS", "1000"))  # stays below SQL Server's 2100 parameter limit
+
+@app.route('/getInvoiceStatuses', methods=['POST'])
+@token_required
+def get_invoice_statuses():
+    """
+    Check the processing status of many invoices in one call.
+
+    Body: {"keyCode": "VTI", "signDate": ..., "ORDER_NOS": [...], "signature": ...}
+    where the signature is generated over the ORDER_NOS values concatenated in order.
+    Returns a map ORDER_NO -> status object (same fields as /getInvoiceStatus) plus
+    the list of ORDER_NOs that were not found.
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return Response(
+                encode_json({"error": "Invalid JSON input"}),
+                content_type="application/json; charset=utf-8",
+                status=400
+            )
+
+        key_code = data.get("keyCode")
+        sign_date = data.get("signDate")
+        order_nos = data.get("ORDER_NOS")
+        client_signature = data.get("signature")
+
+        # Validate required parameters
+        if not all([order_nos, key_code, sign_date, client_signature]) or not isinstance(order_nos, list):
+            return Response(
+                encode_json({"error": "Missing required parameters: ORDER_NOS (array), keyCode, signDate, or signature"}),
+                content_type="application/json; charset=utf-8",
+                status=400
+            )
+        if not all(isinstance(order_no, str) and order_no for order_no in order_nos):
+            return Response(
+                encode_json({"error": "ORDER_NOS must contain non-empty strings"}),
+                content_type="application/json; charset=utf-8",
+                status=400
+            )
+        if len(order_nos) > STATUS_BATCH_MAX_ORDERS:
+            return Response(
+                encode_json({"error": f"Too many ORDER_NOS in one request (maximum {STATUS_BATCH_MAX_ORDERS})"}),
+                content_type="application/json; charset=utf-8",
+                status=400
+            )
+
+        # Validate keyCode
+        if key_code != "VTI":
+            return Response(
+                encode_json({"error": "Invalid keyCode"}),
+                content_type="application/json; charset=utf-8",
+                status=400
+            )
+
+        # Generate server signature over all requested order numbers
+        server_signature = generate_signature(key_code, sign_date, "".join(order_nos))
+
+        # Compare client signature with server signature
+        if client_signature != server_signature:
+            return Response(
+                encode_json({"error": "Invalid signature"}),
+                content_type="application/json; charset=utf-8",
+                status=400
+            )
+
+        unique_order_nos = list(dict.fromkeys(order_nos))
+
+        # Match rows back to the requested spelling (the column collation ignores case and trailing spaces)
+        found = {}
+        for order_no in unique_order_nos:
+            key = status_cache_key(order_no)
+            cached = invoice_status_cache.get(key)
+            if cached is not None:
+                found[key] = cached
+        missing = [order_no for order_no in unique_order_nos if status_cache_key(order_no) not in found]
+
+        if missing:
+            cache_generation = invoice_status_cache.generation
+
+            # Connect to the database
+            conn = get_db_connection()
+            cursor = conn.cursor()
+
+            # One set-based query for everything not served from the cache
+            placeholders = ", ".join("?" * len(missing))
+            query = f"""
+                SELECT inv_no, order_no, status, order_type, sale_amt_word, fail_reason, update_date
+                FROM TaxInv
+                WHERE order_no IN ({placeholders})
+            """
+            cursor.execute(query, missing)
+
+            for invoice in cursor.fetchall():
+                status = invoice_status_to_dict(invoice)
+                cache_terminal_status(status, cache_generation)
+                found[status_cache_key(invoice.order_no)] = status
+
+        result = {}
+        not_found = []
+        for order_no in unique_order_nos:
+            status = found.get(status_cache_key(order_no))
+            if status:
+                result[order_no] = status
+            else:
+                not_found.append(order_no)
+
+        response_json = encode_json({
+            "code": "200",
+            "data": result,
+            "not_found": not_found,
+            "message": f"{len(result)} of {len(unique_order_nos)} invoice statuses retrieved successfully"
+        })
         return Response(response_json, content_type="application/json; charset=utf-8", status=200)
 
     except Exception as e:
         # Handle errors
-        response_json = json.dumps({"error": str(e)}, ensure_ascii=False)
+        response_json = encode_json({"error": str(e)})
         return Response(response_json, content_type="application/json; charset=utf-8", status=500)
 
     finally:
@@ -586,7 +1129,7 @@ def cancel_invoice():
         data = request.get_json()
         if not data:
             return Response(
-                json.dumps({"error": "Invalid JSON input"}, ensure_ascii=False),
+                encode_json({"error": "Invalid JSON input"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -600,7 +1143,7 @@ def cancel_invoice():
         # Validate required parameters
         if not all([order_no, key_code, sign_date, client_signature]):
             return Response(
-                json.dumps({"error": "Missing required parameters: ORDER_NO, keyCode, signDate, or signature"}, ensure_ascii=False),
+                encode_json({"error": "Missing required parameters: ORDER_NO, keyCode, signDate, or signature"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -608,7 +1151,7 @@ def cancel_invoice():
         # Validate keyCode
         if key_code != "VTI":
             return Response(
-                json.dumps({"error": "Invalid keyCode"}, ensure_ascii=False),
+                encode_json({"error": "Invalid keyCode"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -619,7 +1162,7 @@ def cancel_invoice():
         # Compare client signature with server signature
         if client_signature != server_signature:
             return Response(
-                json.dumps({"error": "Invalid signature"}, ensure_ascii=False),
+                encode_json({"error": "Invalid signature"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -628,62 +1171,59 @@ def cancel_invoice():
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        # Query to check if the invoice exists
-        check_query = "SELECT status FROM TaxInv WHERE order_no = ?"
-        cursor.execute(check_query, (order_no,))
+        # Check and cancel in one conditional UPDATE; OUTPUT returns the row for the
+        # response, so there is no separate check/re-read and no race in between
+        cancel_query = """
+            UPDATE TaxInv
+            SET order_type = 'cancel', update_date = GETDATE()
+            OUTPUT INSERTED.inv_no, INSERTED.order_type, INSERTED.status, INSERTED.update_date
+            WHERE order_no = ? AND (status IS NULL OR status <> 'cancel')
+        """
+        cursor.execute(cancel_query, (order_no,))
         invoice = cursor.fetchone()
 
         if not invoice:
+            # Nothing was updated: find out why (only on this error path)
+            conn.rollback()
+            cursor.execute("SELECT status FROM TaxInv WHERE order_no = ?", (order_no,))
+            if not cursor.fetchone():
+                return Response(
+                    encode_json({"error": "No invoice found for the provided ORDER_NO."}),
+                    content_type="application/json; charset=utf-8",
+                    status=404
+                )
+
+            # The invoice is already canceled
             return Response(
-                json.dumps({"error": "No invoice found for the provided ORDER_NO."}, ensure_ascii=False),
-                content_type="application/json; charset=utf-8",
-                status=404
-            )
-
-        # Check if the invoice is already canceled
-        if invoice.status == "cancel":
-            return Response(
-                json.dumps({"error": f"Invoice with ORDER_NO {order_no} is already canceled."}, ensure_ascii=False),
+                encode_json({"error": f"Invoice with ORDER_NO {order_no} is already canceled."}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
 
-        # Update the invoice status to "cancel"
-        cancel_query = """
-            UPDATE TaxInv
-            SET order_type = 'cancel', update_date = GETDATE()
-            WHERE order_no = ?
-        """
-        cursor.execute(cancel_query, (order_no,))
         conn.commit()
+        invoice_status_cache.invalidate(status_cache_key(order_no))
+        invoice_changes.notify()
 
-
-        # Query for response 
-        check_query = "SELECT inv_no, order_type, status, update_date FROM TaxInv WHERE order_no = ?"
-        cursor.execute(check_query, (order_no,))
-        invoice = cursor.fetchone()
-
-        formated_update_date = datetime.strptime(invoice.update_date, "%b %d %Y %I:%M%p").strftime("%d/%m/%Y %H:%M:%S")
         # Map query result to a dictionary
         result = {
             "ORDER_NO": order_no,
             "INV_NO": invoice.inv_no,
             "STATUS": invoice.status,
             "ORDER_TYPE": invoice.order_type,
-            "UPDATE_DATE": formated_update_date
+            "UPDATE_DATE": format_db_datetime(invoice.update_date)
         }
 
         # Return success response
-        response_json = json.dumps({
+        response_json = encode_json({
             "code": "200",
             "data": result,
             "message": f"Request for Cancel ORDER_NO {order_no} receipt successfully."
-        }, ensure_ascii=False)
+        })
         return Response(response_json, content_type="application/json; charset=utf-8", status=200)
 
     except Exception as e:
         # Handle errors
-        response_json = json.dumps({"error": str(e)}, ensure_ascii=False)
+        response_json = encode_json({"error": str(e)})
         return Response(response_json, content_type="application/json; charset=utf-8", status=500)
 
     finally:
@@ -706,7 +1246,7 @@ def search_by_time():
         # Validate required parameters
         if not all([key_code, sign_date, start_time, end_time, client_signature]):
             return Response(
-                json.dumps({"error": "Missing required parameters: keyCode, signDate, startTime, endTime, or signature"}, ensure_ascii=False),
+                encode_json({"error": "Missing required parameters: keyCode, signDate, startTime, endTime, or signature"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -714,7 +1254,7 @@ def search_by_time():
         # Validate keyCode
         if key_code != "VTI":
             return Response(
-                json.dumps({"error": "Invalid keyCode"}, ensure_ascii=False),
+                encode_json({"error": "Invalid keyCode"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -726,7 +1266,7 @@ def search_by_time():
         # Compare client signature with server signature
         if client_signature != server_signature:
             return Response(
-                json.dumps({"error": "Invalid signature"}, ensure_ascii=False),
+                encode_json({"error": "Invalid signature"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -747,45 +1287,53 @@ def search_by_time():
 
         if not records:
             return Response(
-                json.dumps({"error": "No records found within the specified time frame."}, ensure_ascii=False),
+                encode_json({"error": "No records found within the specified time frame."}),
                 content_type="application/json; charset=utf-8",
                 status=404
             )
 
-        
-        formated_create_date = datetime.strptime(record.create_date, "%b %d %Y %I:%M%p").strftime("%d/%m/%Y %H:%M:%S")
-        formated_update_date = datetime.strptime(record.update_date, "%b %d %Y %I:%M%p").strftime("%d/%m/%Y %H:%M:%S")
-       
-
         # Map query results to a list of dictionaries
         result = [
             {
                 "INV_NO": record.inv_no,
                 "ORDER_NO": record.order_no,
                 "STATUS": record.status,
-                "CREATE_DATE": formated_create_date,
-                "UPDATE_DATE": formated_update_date
+                "CREATE_DATE": format_db_datetime(record.create_date),
+                "UPDATE_DATE": format_db_datetime(record.update_date)
             }
             for record in records
         ]
 
         # Return the response
-        response_json = json.dumps({
+        response_json = encode_json({
             "code": "200",
             "data": result,
             "message": "Records retrieved successfully."
-        }, ensure_ascii=False)
+        })
         return Response(response_json, content_type="application/json; charset=utf-8", status=200)
 
     except Exception as e:
         # Handle errors
-        response_json = json.dumps({"error": str(e)}, ensure_ascii=False)
+        response_json = encode_json({"error": str(e)})
         return Response(response_json, content_type="application/json; charset=utf-8", status=500)
 
     finally:
         if 'conn' in locals() and conn:
             conn.close()
 
+def search_record_to_dict(record):
+    """Map a /searchByDate row to its JSON shape."""
+    return {
+        "ORDER_NO": record.order_no,
+        "INV_NO": record.inv_no,
+        "STATUS": record.status,
+        "ORDER_TYPE": record.order_type,
+        "SALE_AMT_WORD": record.sale_amt_word,
+        "FAIL_REASON": record.fail_reason,
+        "CREATE_DATE": format_db_datetime(record.create_date),
+        "UPDATE_DATE": format_db_datetime(record.update_date)
+    }
+
 @app.route('/searchByDate', methods=['POST'])
 @token_required  # Add this line to protect the route
 def search_by_date():
@@ -795,7 +1343,7 @@ def search_by_date():
         payload = request.get_json()
         if not payload:
             return Response(
-                json.dumps({"error": "Invalid JSON input"}, ensure_ascii=False),
+                encode_json({"error": "Invalid JSON input"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -817,7 +1365,7 @@ def search_by_date():
         # Validate required parameters
         if not all([key_code, sign_date, start_date, end_date, client_signature]):
             return Response(
-                json.dumps({"error": "Missing required parameters: keyCode, signDate, startDate, endDate, or signature"}, ensure_ascii=False),
+                encode_json({"error": "Missing required parameters: keyCode, signDate, startDate, endDate, or signature"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -825,7 +1373,7 @@ def search_by_date():
         # Validate keyCode
         if key_code != "VTI":
             return Response(
-                json.dumps({"error": "Invalid keyCode"}, ensure_ascii=False),
+                encode_json({"error": "Invalid keyCode"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -837,18 +1385,17 @@ def search_by_date():
         # Compare client signature with server signature
         if client_signature != server_signature:
             return Response(
-                json.dumps({"error": "Invalid signature"}, ensure_ascii=False),
+                encode_json({"error": "Invalid signature"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
 
         # Ensure dates are formatted correctly
         try:
-            start_date = start_date.strip()
-            end_date = end_date.strip()
+            range_start, range_end = date_range_bounds(start_date, end_date)
         except Exception as e:
             return Response(
-                json.dumps({"error": f"Invalid date format: {str(e)}"}, ensure_ascii=False),
+                encode_json({"error": f"Invalid date format: {str(e)}"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -857,22 +1404,34 @@ def search_by_date():
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        # Query to fetch records within the date range
+        # Query to fetch records within the date range.
+        # Half-open range on the raw column (no CAST). This seeks IX_TaxInv_create_date
+        # only once migrations/004 has made create_date datetime2; on the legacy
+        # varchar column the comparison adds CONVERT_IMPLICIT and still scans.
         query = """
             SELECT inv_no, order_no, status, order_type, sale_amt_word, fail_reason, create_date, update_date
             FROM TaxInv
-            WHERE CAST(create_date AS DATE) BETWEEN ? AND ?
+            WHERE create_date >= ? AND create_date < ?
             ORDER BY create_date ASC
         """
-        cursor.execute(query, (start_date, end_date))
-        records = cursor.fetchall()
+        cursor.execute(query, (range_start, range_end))
+        records = cursor.fetchmany(STREAM_FETCH_SIZE) if stream_requested() else cursor.fetchall()
 
         if not records:
             return Response(
-                json.dumps({"error": "No records found within the specified date range."}, ensure_ascii=False),
+                encode_json({"error": "No records found within the specified date range."}),
                 content_type="application/json; charset=utf-8",
                 status=404
             )
+
+        if stream_requested():
+            response = stream_json_response(
+                conn,
+                (search_record_to_dict(record) for record in iter_cursor_rows(cursor, records)),
+                envelope={"code": "200", "message": "Records retrieved successfully."}
+            )
+            conn = None  # Closed by the streamed response once the body is sent
+            return response
         #change format for the date on json output
         # formated_create_date = datetime.strptime(record.create_date, "%b %d %Y %I:%M%p").strftime("%d/%m/%Y %H:%M:%S")
         # formated_update_date = datetime.strptime(record.update_date, "%b %d %Y %I:%M%p").strftime("%d/%m/%Y %H:%M:%S")
@@ -890,53 +1449,100 @@ def search_by_date():
         # ]
 
         # Map query results to a list of dictionaries
-        result = []
-        for record in records:
-            # Change format for the date on JSON output
-            formated_create_date = datetime.strptime(record.create_date, "%b %d %Y %I:%M%p").strftime("%d/%m/%Y %H:%M:%S")
-            formated_update_date = datetime.strptime(record.update_date, "%b %d %Y %I:%M%p").strftime("%d/%m/%Y %H:%M:%S")
-            
-            result.append({
-                "ORDER_NO": record.order_no,
-                "INV_NO": record.inv_no,
-                "STATUS": record.status,
-                "ORDER_TYPE": record.order_type,
-                "SALE_AMT_WORD": record.sale_amt_word,
-                "FAIL_REASON": record.fail_reason,
-                "CREATE_DATE": formated_create_date,
-                "UPDATE_DATE": formated_update_date
-            })
+        result = [search_record_to_dict(record) for record in records]
 
 
 
 
         # Return the response
-        response_json = json.dumps({
+        response_json = encode_json({
             "code": "200",
             "data": result,
             "message": "Records retrieved successfully."
-        }, ensure_ascii=False)
+        })
         return Response(response_json, content_type="application/json; charset=utf-8", status=200)
 
     except Exception as e:
         # Handle errors
-        response_json = json.dumps({"error": str(e)}, ensure_ascii=False)
+        response_json = encode_json({"error": str(e)})
         return Response(response_json, content_type="application/json; charset=utf-8", status=500)
 
     finally:
         if 'conn' in locals() and conn:
             conn.close()
 
+def retrieved_invoice_to_dict(invoice):
+    """Map a waiting TaxInv row to one /retrieveInvoices list item."""
+    return {
+        "code": "200",
+        "data": {
+            "ORDER_NO": invoice.order_no,
+            "STATUS": invoice.status,
+            "FAIL_REASON": invoice.fail_reason or "",
+            "OPER_TYPE": invoice.order_type
+        },
+        "message": "Invoice retrieved successfully"
+    }
+
+# --- Claim mode for /retrieveInvoices (needs migrations/002_taxinv_leases.sql) ---
+RETRIEVE_CLAIM_MAX = int(os.getenv("RETRIEVE_CLAIM_MAX", "500"))
+RETRIEVE_LEASE_SECONDS = int(os.getenv("RETRIEVE_LEASE_SECONDS", "300"))
+RETRIEVE_LEASE_MAX_SECONDS = int(os.getenv("RETRIEVE_LEASE_MAX_SECONDS", "3600"))
+
+def claim_waiting_invoices(cursor, status, claim_size, worker, lease_seconds):
+    """
+    Atomically lease up to claim_size unleased (or lease-expired) orders with the given
+    status to worker and return them. READPAST skips rows another poller is claiming
+    right now, so concurrent workers never receive the same order. Orders whose lease
+    ran out without a status update are picked up again automatically.
+    The caller commits.
+    """
+    claim_query = """
+        WITH next_orders AS (
+            SELECT TOP (?) order_no, status, fail_reason, order_type, lease_owner, lease_expires_at
+            FROM TaxInv WITH (ROWLOCK, UPDLOCK, READPAST)
+            WHERE status = ? AND (lease_expires_at IS NULL OR lease_expires_at < GETDATE())
+            ORDER BY create_date, order_no
+        )
+        UPDATE next_orders
+        SET lease_owner = ?, lease_expires_at = DATEADD(SECOND, ?, GETDATE())
+        OUTPUT INSERTED.order_no, INSERTED.status, INSERTED.fail_reason, INSERTED.order_type
+    """
+    cursor.execute(claim_query, (claim_size, status, worker, lease_seconds))
+    return cursor.fetchall()
+
+# --- Conditional GET for the retrieve listings (needs migrations/003_taxinv_rowversion.sql) ---
+RETRIEVE_VERSION_QUERY = """
+    SELECT COUNT_BIG(*) AS row_count, MAX(row_ver) AS max_row_ver
+    FROM TaxInv
+    WHERE status = ?
+"""
+RETRIEVE_CANCEL_VERSION_QUERY = """
+    SELECT COUNT_BIG(*) AS row_count, MAX(row_ver) AS max_row_ver
+    FROM TaxInv
+    WHERE status = ? AND order_type = ?
+"""
+
 @app.route('/retrieveInvoices', methods=['GET'])
 @token_required  # Add this line to protect the route
 def retrieve_invoices():
-    """Retrieve all invoices with status = 'wait'."""
+    """
+    Retrieve all invoices with status = 'wait'.
+
+    Claim mode: with Data.CLAIM = N the call instead leases up to N waiting orders
+    to Data.WORKER (default: the caller's address) for Data.LEASE_SECONDS and
+    returns only those, so repeated or concurrent polls do not receive them again
+    until the lease expires.
+
+    Outside claim mode the response carries an ETag; a repeat call sending it in
+    If-None-Match gets 304 Not Modified while the waiting set is unchanged.
+    """
     try:
         # Parse the JSON payload
         data = request.get_json()
         if not data:
             return Response(
-                json.dumps({"error": "Invalid JSON input"}, ensure_ascii=False),
+                encode_json({"error": "Invalid JSON input"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -946,14 +1552,14 @@ def retrieve_invoices():
         missing_fields = [field for field in required_fields if field not in data]
         if missing_fields:
             return Response(
-                json.dumps({"error": f"Missing required field(s): {', '.join(missing_fields)}"}, ensure_ascii=False),
+                encode_json({"error": f"Missing required field(s): {', '.join(missing_fields)}"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
 
         if data["keyCode"] != "APIS":
             return Response(
-                json.dumps({"error": "Invalid keyCode"}, ensure_ascii=False),
+                encode_json({"error": "Invalid keyCode"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -967,11 +1573,29 @@ def retrieve_invoices():
         # Validate the required "STATUS" field
         if not status or status != "wait":
             return Response(
-                json.dumps({"error": "Invalid or missing 'STATUS' in 'Data'. Only 'wait' is allowed."}, ensure_ascii=False),
+                encode_json({"error": "Invalid or missing 'STATUS' in 'Data'. Only 'wait' is allowed."}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
 
+        # Optional claim mode parameters
+        claim_size = data["Data"].get("CLAIM")
+        if claim_size is not None:
+            lease_seconds = data["Data"].get("LEASE_SECONDS", RETRIEVE_LEASE_SECONDS)
+            worker = clean_string(data["Data"].get("WORKER")) or request.remote_addr or "unknown"
+            if not isinstance(claim_size, int) or isinstance(claim_size, bool) or not 1 <= claim_size <= RETRIEVE_CLAIM_MAX:
+                return Response(
+                    encode_json({"error": f"'CLAIM' must be an integer between 1 and {RETRIEVE_CLAIM_MAX}."}),
+                    content_type="application/json; charset=utf-8",
+                    status=400
+                )
+            if not isinstance(lease_seconds, int) or isinstance(lease_seconds, bool) or not 1 <= lease_seconds <= RETRIEVE_LEASE_MAX_SECONDS:
+                return Response(
+                    encode_json({"error": f"'LEASE_SECONDS' must be an integer between 1 and {RETRIEVE_LEASE_MAX_SECONDS}."}),
+                    content_type="application/json; charset=utf-8",
+                    status=400
+                )
+
         # Generate server signature
         #string_to_sign = f"{key_code}{sign_date}{status}"  # I think no need since it is alreaddy in generate_signature function
         server_signature = generate_signature_apis(key_code, sign_date)
@@ -979,7 +1603,7 @@ def retrieve_invoices():
         # Compare client signature with server signature
         if client_signature != server_signature:
             return Response(
-                json.dumps({"error": "Invalid signature"}, ensure_ascii=False),
+                encode_json({"error": "Invalid signature"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -988,6 +1612,35 @@ def retrieve_invoices():
         conn = get_db_connection()
         cursor = conn.cursor()
 
+        if claim_size is not None:
+            invoices = claim_waiting_invoices(cursor, status, claim_size, str(worker)[:64], lease_seconds)
+            conn.commit()
+
+            if not invoices:
+                return Response(
+                    encode_json({"error": "No invoices found with status = 'wait'."}),
+                    content_type="application/json; charset=utf-8",
+                    status=404
+                )
+
+            return Response(
+                encode_json([retrieved_invoice_to_dict(invoice) for invoice in invoices]),
+                content_type="application/json; charset=utf-8",
+                status=200
+            )
+
+        # Version of the result set: any insert, update or delete of a matching
+        # row changes the count or bumps MAX(row_ver)
+        etag, version = result_set_etag(cursor, RETRIEVE_VERSION_QUERY, (status,), status)
+        if not version.row_count:
+            return Response(
+                encode_json({"error": "No invoices found with status = 'wait'."}),
+                content_type="application/json; charset=utf-8",
+                status=404
+            )
+        if etag_matches(etag):
+            return not_modified_response(etag)
+
         # Query to fetch invoices with status = 'wait'
         query = """
             SELECT order_no, status, fail_reason, order_type
@@ -995,40 +1648,166 @@ def retrieve_invoices():
             WHERE status = ?
         """
         cursor.execute(query, (status,))
-        invoices = cursor.fetchall()
+        invoices = cursor.fetchmany(STREAM_FETCH_SIZE) if stream_requested() else cursor.fetchall()
 
         if not invoices:
             return Response(
-                json.dumps({"error": "No invoices found with status = 'wait'."}, ensure_ascii=False),
+                encode_json({"error": "No invoices found with status = 'wait'."}),
                 content_type="application/json; charset=utf-8",
                 status=404
             )
 
+        if stream_requested():
+            response = stream_json_response(
+                conn, (retrieved_invoice_to_dict(invoice) for invoice in iter_cursor_rows(cursor, invoices))
+            )
+            conn = None  # Closed by the streamed response once the body is sent
+            response.set_etag(etag, weak=True)
+            return response
+
         # Prepare the response for all retrieved invoices
-        response_data = [
-            {
-                "code": "200",
-                "data": {
-                    "ORDER_NO": invoice.order_no,
-                    "STATUS": invoice.status,
-                    "FAIL_REASON": invoice.fail_reason or "",
-                    "OPER_TYPE": invoice.order_type
-                },
-                "message": "Invoice retrieved successfully"
-            }
-            for invoice in invoices
-        ]
+        response_data = [retrieved_invoice_to_dict(invoice) for invoice in invoices]
 
         # Return the response as JSON
-        return Response(
-            json.dumps(response_data, ensure_ascii=False),
+        response = Response(
+            encode_json(response_data),
             content_type="application/json; charset=utf-8",
             status=200
         )
+        response.set_etag(etag, weak=True)
+        return response
 
     except Exception as e:
         # Handle errors
-        response_json = json.dumps({"error": str(e)}, ensure_ascii=False)
+        response_json = encode_json({"error": str(e)})
+        return Response(response_json, content_type="application/json; charset=utf-8", status=500)
+
+    finally:
+        if 'conn' in locals() and conn:
+            conn.close()
+
+# --- Long-poll change feed (needs migrations/005_taxinv_change_log.sql) ---
+WATCH_DEFAULT_TIMEOUT = 25  # seconds
+WATCH_MAX_TIMEOUT = int(os.getenv("WATCH_MAX_TIMEOUT", "30"))
+WATCH_BATCH_SIZE = int(os.getenv("WATCH_BATCH_SIZE", "500"))
+WATCH_RETRY_AFTER = int(os.getenv("WATCH_RETRY_AFTER", "5"))  # seconds, sent when every waiter slot is taken
+
+def fetch_waiting_changes(cursor, since):
+    """
+    Return waiting orders (new uploads and cancel requests) that changed after the
+    `since` rowversion, oldest change first. Changes come from TaxInvChange, which
+    lease claims do not touch, so claiming an order does not re-send it. Rows
+    written by transactions that are still open are held back
+    (MIN_ACTIVE_ROWVERSION) so none are skipped.
+    """
+    query = """
+        SELECT TOP (?) t.order_no, t.status, t.fail_reason, t.order_type,
+               CAST(c.change_ver AS bigint) AS change_ver
+        FROM TaxInvChange AS c
+        JOIN TaxInv AS t ON t.order_no = c.order_no
+        WHERE c.change_ver > CONVERT(binary(8), CAST(? AS bigint))
+          AND c.change_ver < MIN_ACTIVE_ROWVERSION()
+          AND t.status = 'wait'
+        ORDER BY c.change_ver
+    """
+    cursor.execute(query, (WATCH_BATCH_SIZE, since))
+    return cursor.fetchall()
+
+@app.route('/watchInvoices', methods=['GET'])
+@token_required
+def watch_invoices():
+    """
+    Long-poll for 'wait' orders (new uploads and cancel requests, see OPER_TYPE)
+    that changed after the client's high-water mark.
+
+    Data: {"SINCE": <HIGH_WATER from the previous call, 0 to start>, "TIMEOUT": <seconds>}
+    Returns immediately when there are changes; otherwise blocks until an upload or
+    cancel in this process signals one (or TIMEOUT passes) and checks once more.
+    Always returns HIGH_WATER to send as SINCE on the next call. When every waiter
+    slot (LONGPOLL_MAX_WAITERS) is taken it answers 503 with Retry-After instead of
+    an empty 200, so clients back off rather than re-polling at once.
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return Response(
+                encode_json({"error": "Invalid JSON input"}),
+                content_type="application/json; charset=utf-8",
+                status=400
+            )
+
+        # Validate required fields
+        required_fields = ["keyCode", "signDate", "signature", "Data"]
+        missing_fields = [field for field in required_fields if field not in data]
+        if missing_fields:
+            return Response(
+                encode_json({"error": f"Missing required field(s): {', '.join(missing_fields)}"}),
+                content_type="application/json; charset=utf-8",
+                status=400
+            )
+
+        if data["keyCode"] != "APIS":
+            return Response(
+                encode_json({"error": "Invalid keyCode"}),
+                content_type="application/json; charset=utf-8",
+                status=400
+            )
+
+        since = data["Data"].get("SINCE", 0)
+        timeout = data["Data"].get("TIMEOUT", WATCH_DEFAULT_TIMEOUT)
+        if not isinstance(since, int) or isinstance(since, bool) or since < 0:
+            return Response(
+                encode_json({"error": "'SINCE' must be a non-negative integer high-water mark."}),
+                content_type="application/json; charset=utf-8",
+                status=400
+            )
+        if not isinstance(timeout, (int, float)) or isinstance(timeout, bool) or not 0 <= timeout <= WATCH_MAX_TIMEOUT:
+            return Response(
+                encode_json({"error": f"'TIMEOUT' must be between 0 and {WATCH_MAX_TIMEOUT} seconds."}),
+                content_type="application/json; charset=utf-8",
+                status=400
+            )
+
+        server_signature = generate_signature_apis(data["keyCode"], data["signDate"])
+        if data["signature"] != server_signature:
+            return Response(
+                encode_json({"error": "Invalid signature"}),
+                content_type="application/json; charset=utf-8",
+                status=400
+            )
+
+        # Remember the notifier version before looking, so a change committed
+        # between our query and the wait still wakes us up
+        seen_version = invoice_changes.version
+
+        conn = get_db_connection()
+        changes = fetch_waiting_changes(conn.cursor(), since)
+
+        if not changes and timeout > 0:
+            # Give the connection back while we wait
+            conn.close()
+            conn = None
+            if invoice_changes.wait(seen_version, timeout) is None:
+                return Response(
+                    encode_json({"error": "Too many clients are waiting for changes; retry later.", "HIGH_WATER": since}),
+                    content_type="application/json; charset=utf-8",
+                    status=503,
+                    headers={"Retry-After": str(WATCH_RETRY_AFTER)}
+                )
+            conn = get_db_connection()
+            changes = fetch_waiting_changes(conn.cursor(), since)
+
+        response_json = encode_json({
+            "code": "200",
+            "data": [retrieved_invoice_to_dict(invoice) for invoice in changes],
+            "HIGH_WATER": changes[-1].change_ver if changes else since,
+            "message": "Invoice changes retrieved successfully" if changes else "No new invoice changes"
+        })
+        return Response(response_json, content_type="application/json; charset=utf-8", status=200)
+
+    except Exception as e:
+        # Handle errors
+        response_json = encode_json({"error": str(e)})
         return Response(response_json, content_type="application/json; charset=utf-8", status=500)
 
     finally:
@@ -1038,13 +1817,16 @@ def retrieve_invoices():
 @app.route('/retrieveCancelInvoices', methods=['GET'])
 @token_required  # Protect the route with the token decorator
 def retrieve_cancelinvoices():
-    """Retrieve all invoices with status = 'wait' and OPER_TYPE = 'cancel'."""
+    """
+    Retrieve all invoices with status = 'wait' and OPER_TYPE = 'cancel'.
+    Answers 304 Not Modified when If-None-Match still matches the set's ETag.
+    """
     try:
         # Parse the JSON payload
         data = request.get_json()
         if not data:
             return Response(
-                json.dumps({"error": "Invalid JSON input"}, ensure_ascii=False),
+                encode_json({"error": "Invalid JSON input"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -1054,14 +1836,14 @@ def retrieve_cancelinvoices():
         missing_fields = [field for field in required_fields if field not in data]
         if missing_fields:
             return Response(
-                json.dumps({"error": f"Missing required field(s): {', '.join(missing_fields)}"}, ensure_ascii=False),
+                encode_json({"error": f"Missing required field(s): {', '.join(missing_fields)}"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
 
         if data["keyCode"] != "APIS":
             return Response(
-                json.dumps({"error": "Invalid keyCode"}, ensure_ascii=False),
+                encode_json({"error": "Invalid keyCode"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -1076,15 +1858,13 @@ def retrieve_cancelinvoices():
         # Validate the required "STATUS" and "OPER_TYPE" fields
         if not status or status != "wait":
             return Response(
-                json.dumps({"error": "Invalid or missing 'STATUS' in 'Data'. Only 'wait' is allowed."},
-                           ensure_ascii=False),
+                encode_json({"error": "Invalid or missing 'STATUS' in 'Data'. Only 'wait' is allowed."}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
         if not oper_type or oper_type != "cancel":
             return Response(
-                json.dumps({"error": "Invalid or missing 'ORDER_TYPE' in 'Data'. Only 'cancel' is allowed."},
-                           ensure_ascii=False),
+                encode_json({"error": "Invalid or missing 'ORDER_TYPE' in 'Data'. Only 'cancel' is allowed."}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -1095,7 +1875,7 @@ def retrieve_cancelinvoices():
         # Compare client signature with server signature
         if client_signature != server_signature:
             return Response(
-                json.dumps({"error": "Invalid signature"}, ensure_ascii=False),
+                encode_json({"error": "Invalid signature"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -1104,6 +1884,17 @@ def retrieve_cancelinvoices():
         conn = get_db_connection()
         cursor = conn.cursor()
 
+        etag, version = result_set_etag(cursor, RETRIEVE_CANCEL_VERSION_QUERY, (status, oper_type),
+                                        status, oper_type)
+        if not version.row_count:
+            return Response(
+                encode_json({"error": "No invoices found with status = 'wait' and OPER_TYPE = 'cancel'."}),
+                content_type="application/json; charset=utf-8",
+                status=404
+            )
+        if etag_matches(etag):
+            return not_modified_response(etag)
+
         # Query to fetch invoices with status = 'wait' and order_type = 'cancel'
         query = """
             SELECT order_no, status, fail_reason, order_type
@@ -1115,8 +1906,7 @@ def retrieve_cancelinvoices():
 
         if not invoices:
             return Response(
-                json.dumps({"error": "No invoices found with status = 'wait' and OPER_TYPE = 'cancel'."},
-                           ensure_ascii=False),
+                encode_json({"error": "No invoices found with status = 'wait' and OPER_TYPE = 'cancel'."}),
                 content_type="application/json; charset=utf-8",
                 status=404
             )
@@ -1137,15 +1927,17 @@ def retrieve_cancelinvoices():
         ]
 
         # Return the response as JSON
-        return Response(
-            json.dumps(response_data, ensure_ascii=False),
+        response = Response(
+            encode_json(response_data),
             content_type="application/json; charset=utf-8",
             status=200
         )
+        response.set_etag(etag, weak=True)
+        return response
 
     except Exception as e:
         # Handle errors
-        response_json = json.dumps({"error": str(e)}, ensure_ascii=False)
+        response_json = encode_json({"error": str(e)})
         return Response(response_json, content_type="application/json; charset=utf-8", status=500)
 
     finally:
@@ -1161,7 +1953,7 @@ def update_invoice_status():
         data = request.get_json()
         if not data:
             return Response(
-                json.dumps({"error": "Invalid JSON input"}, ensure_ascii=False),
+                encode_json({"error": "Invalid JSON input"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -1171,14 +1963,14 @@ def update_invoice_status():
         missing_fields = [field for field in required_fields if field not in data]
         if missing_fields:
             return Response(
-                json.dumps({"error": f"Missing required field(s): {', '.join(missing_fields)}"}, ensure_ascii=False),
+                encode_json({"error": f"Missing required field(s): {', '.join(missing_fields)}"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
 
         if data["keyCode"] != "APIS":
             return Response(
-                json.dumps({"error": "Invalid keyCode"}, ensure_ascii=False),
+                encode_json({"error": "Invalid keyCode"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -1195,7 +1987,7 @@ def update_invoice_status():
         missing_data_fields = [field for field in required_data_fields if field not in update_data]
         if missing_data_fields:
             return Response(
-                json.dumps({"error": f"Missing required Data field(s): {', '.join(missing_data_fields)}"}, ensure_ascii=False),
+                encode_json({"error": f"Missing required Data field(s): {', '.join(missing_data_fields)}"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -1207,7 +1999,7 @@ def update_invoice_status():
         allowed_status = ["success", "fail", "cancel"]
         if status not in allowed_status:
             return Response(
-                json.dumps({"error": f"Invalid status. Allowed values: {', '.join(allowed_status)}"}, ensure_ascii=False),
+                encode_json({"error": f"Invalid status. Allowed values: {', '.join(allowed_status)}"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -1219,7 +2011,7 @@ def update_invoice_status():
         # Compare client signature with server signature
         if client_signature != server_signature:
             return Response(
-                json.dumps({"error": "Invalid signature"}, ensure_ascii=False),
+                encode_json({"error": "Invalid signature"}),
                 content_type="application/json; charset=utf-8",
                 status=400
             )
@@ -1235,7 +2027,7 @@ def update_invoice_status():
 
         if not order_:
             return Response(
-                json.dumps({"error": f"No Order found with ORDER_NO: {order_no}"}, ensure_ascii=False),
+                encode_json({"error": f"No Order found with ORDER_NO: {order_no}"}),
                 content_type="application/json; charset=utf-8",
                 status=404
             )
@@ -1251,6 +2043,7 @@ def update_invoice_status():
         """
         cursor.execute(update_query, (inv_no, status, fail_reason, order_no))
         conn.commit()
+        invoice_status_cache.invalidate(status_cache_key(order_no))
 
         # Prepare the response
         response_data = {
@@ -1259,139 +2052,205 @@ def update_invoice_status():
                 "ORDER_NO": order_no,
                 "INV_NO": inv_no,
                 "STATUS": status,
-                "UPDATE_DATE": cursor.execute("SELECT GETDATE()").fetchone()[0].strftime("%d/%m/%Y %H:%M:%S")
+                "UPDATE_DATE": format_datetime(cursor.execute("SELECT GETDATE()").fetchone()[0])
             },
             "message": "Order/Invoice updated successfully"
         }
 
         return Response(
-            json.dumps(response_data, ensure_ascii=False),
+            encode_json(response_data),
             content_type="application/json; charset=utf-8",
             status=200
         )
 
     except Exception as e:
         # Handle errors
-        response_json = json.dumps({"error": str(e)}, ensure_ascii=False)
+        response_json = encode_json({"error": str(e)})
         return Response(response_json, content_type="application/json; charset=utf-8", status=500)
 
     finally:
         if 'conn' in locals() and conn:
             conn.close()
 
-from flask import Flask, request, jsonify
+# --- Batch status updates ---
+UPDATE_BATCH_MAX_ORDERS = int(os.getenv("UPDATE_BATCH_MAX_ORDERS", "500"))  # 4 parameters per order, SQL Server allows 2100
+
+@app.route('/updateInvoiceStatuses', methods=['PATCH'])
+@token_required
+def update_invoice_statuses():
+    """
+    Update the status of many invoices in one call.
+
+    Body: {"keyCode": "APIS", "signDate": ..., "signature": ...,
+           "Data": [{"ORDER_NO": ..., "INV_NO": ..., "STATUS": ..., "FAIL_REASON": ...}, ...]}
+    where the signature is generated like /updateInvoiceStatus with the ORDER_NOs
+    concatenated in order in place of the single ORDER_NO.
+    All valid items are applied by one UPDATE ... FROM (VALUES ...) statement whose
+    OUTPUT reports which orders matched and their new update_date; the response
+    lists one result per item, in request order, with 404 for unknown orders.
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return Response(
+                encode_json({"error": "Invalid JSON input"}),
+                content_type="application/json; charset=utf-8",
+                status=400
+            )
 
+        # Validate required fields
+        required_fields = ["keyCode", "signDate", "signature", "Data"]
+        missing_fields = [field for field in required_fields if field not in data]
+        if missing_fields:
+            return Response(
+                encode_json({"error": f"Missing required field(s): {', '.join(missing_fields)}"}),
+                content_type="application/json; charset=utf-8",
+                status=400
+            )
 
-# Updated number-to-Lao conversion function
-def number_to_words(number):
-    units = ["", "ໜຶ່ງ", "ສອງ", "ສາມ", "ສີ່", "ຫ້າ", "ຫົກ", "ເຈັດ", "ແປດ", "ເກົ້າ"]
-    teens = ["ສິບ", "ສິບເອັດ", "ສິບສອງ", "ສິບສາມ", "ສິບສີ່", "ສິບຫ້າ", "ສິບຫົກ",
-             "ສິບເຈັດ", "ສິບແປດ", "ສິບເກົ້າ"]
-    tens = ["", "ສິບ", "ຊາວ", "ສາມສິບ", "ສີ່ສິບ", "ຫ້າສິບ", "ຫົກສິບ", "ເຈັດສິບ",
-            "ແປດສິບ", "ເກົ້າສິບ"]
-
-    if number == 0:
-        return "ສູນ"
-    elif number < 10:
-        return units[number]
-    elif 10 <= number < 20:
-        return teens[number - 10]
-    elif 20 <= number < 100:
-        if number % 10 == 1:
-            return tens[number // 10] + "ເອັດ"
-        else:
-            return tens[number // 10] + ("" + number_to_words(number % 10) if number % 10 != 0 else "")
-    elif 100 <= number < 1000:
-        hundreds_digit = number // 100
-        remainder = number % 100
-        if remainder == 0:
-            return units[hundreds_digit] + "ຮ້ອຍ"
-        else:
-            return units[hundreds_digit] + "ຮ້ອຍ" + number_to_words(remainder)
-    elif 1000 <= number < 100000:
-        thousands_part = number // 1000
-        remainder = number % 1000
-        thousands_word = number_to_words(thousands_part) + "ພັນ"
-        if remainder == 0:
-            return thousands_word
-        else:
-            return thousands_word + number_to_words(remainder)
-    elif 100000 <= number < 1000000:  # Fix for 100,000 to 999,999
-        hundred_thousands_part = number // 100000
-        remainder = number % 100000
-        hundred_thousands_word = number_to_words(hundred_thousands_part) + "ແສນ"
-        if remainder == 0:
-            return hundred_thousands_word
-        else:
-            return hundred_thousands_word + number_to_words(remainder)
-    elif 1000000 <= number < 1000000000:
-        millions_part = number // 1000000
-        remainder = number % 1000000
-        millions_word = number_to_words(millions_part) + "ລ້ານ"
-        if remainder == 0:
-            return millions_word
-        else:
-            return millions_word + number_to_words(remainder)
-    elif 1000000000 <= number < 1000000000000:
-        billions_part = number // 1000000000
-        remainder = number % 1000000000
-        billions_word = number_to_words(billions_part) + "ຕື້"
-        if remainder == 0:
-            return billions_word
-        else:
-            return billions_word + number_to_words(remainder)
-    else:
-        return "Number out of range"
+        if data["keyCode"] != "APIS":
+            return Response(
+                encode_json({"error": "Invalid keyCode"}),
+                content_type="application/json; charset=utf-8",
+                status=400
+            )
+
+        items = data["Data"]
+        if not isinstance(items, list) or not items:
+            return Response(
+                encode_json({"error": "'Data' must be a non-empty array of updates"}),
+                content_type="application/json; charset=utf-8",
+                status=400
+            )
+        if len(items) > UPDATE_BATCH_MAX_ORDERS:
+            return Response(
+                encode_json({"error": f"Too many updates in one request (maximum {UPDATE_BATCH_MAX_ORDERS})"}),
+                content_type="application/json; charset=utf-8",
+                status=400
+            )
 
-def number_with_decimals_to_words(number):    
-    """ Convert a number with up to two decimal places to words in Lao. """
-    integer_part = int(number)
-    decimal_part = round((number - integer_part) * 100)  # Extract two decimal places
+        order_nos = [item.get("ORDER_NO") if isinstance(item, dict) else None for item in items]
+        if not all(isinstance(order_no, str) and order_no for order_no in order_nos):
+            return Response(
+                encode_json({"error": "Every item in 'Data' must be an object with a non-empty ORDER_NO"}),
+                content_type="application/json; charset=utf-8",
+                status=400
+            )
 
-    words = number_to_words(integer_part)  # Convert integer part correctly
+        # Generate server signature (same argument order as /updateInvoiceStatus)
+        server_signature = generate_signature(data["keyCode"], "".join(order_nos), data["signDate"])
+        if data["signature"] != server_signature:
+            return Response(
+                encode_json({"error": "Invalid signature"}),
+                content_type="application/json; charset=utf-8",
+                status=400
+            )
 
-    if decimal_part > 0:
-        decimal_digits = str(decimal_part).zfill(2)  # Ensure two digits
-        decimal_words = "ຈຸດ" + "".join([number_to_words(int(digit)) for digit in decimal_digits])
-        return words + decimal_words
-    else:
-        return words
+        # Per-item validation; invalid items are reported and skipped
+        allowed_status = ["success", "fail", "cancel"]
+        results = [None] * len(items)
+        updates = []  # (index, order_no, inv_no, status, fail_reason)
+        seen_order_nos = set()
+        for index, item in enumerate(items):
+            order_no = item["ORDER_NO"]
+            status = item.get("STATUS")
+            if status not in allowed_status:
+                results[index] = {"ORDER_NO": order_no, "code": "400", "error": f"Invalid status. Allowed values: {', '.join(allowed_status)}"}
+            elif status_cache_key(order_no) in seen_order_nos:
+                results[index] = {"ORDER_NO": order_no, "code": "400", "error": "ORDER_NO appears more than once in this batch"}
+            else:
+                seen_order_nos.add(status_cache_key(order_no))
+                updates.append((index, order_no, item.get("INV_NO"), status, item.get("FAIL_REASON", "")))
+
+        if updates:
+            # Connect to the database
+            conn = get_db_connection()
+            cursor = conn.cursor()
+
+            values = ", ".join("(?, ?, ?, ?)" for _ in updates)
+            update_query = f"""
+                UPDATE t
+                SET inv_no = v.inv_no, status = v.status, fail_reason = v.fail_reason, update_date = GETDATE()
+                OUTPUT INSERTED.order_no, INSERTED.inv_no, INSERTED.status, INSERTED.update_date
+                FROM TaxInv AS t
+                JOIN (VALUES {values}) AS v (order_no, inv_no, status, fail_reason)
+                  ON t.order_no = v.order_no
+            """
+            params = [value for _, order_no, inv_no, status, fail_reason in updates
+                      for value in (order_no, inv_no, status, fail_reason)]
+            cursor.execute(update_query, params)
+            updated = {status_cache_key(row.order_no): row for row in cursor.fetchall()}
+            conn.commit()
+            invoice_status_cache.invalidate(*updated)
+
+            for index, order_no, _, _, _ in updates:
+                row = updated.get(status_cache_key(order_no))
+                if row:
+                    results[index] = {
+                        "ORDER_NO": order_no,
+                        "INV_NO": row.inv_no,
+                        "STATUS": row.status,
+                        "UPDATE_DATE": format_db_datetime(row.update_date),
+                        "code": "200"
+                    }
+                else:
+                    results[index] = {"ORDER_NO": order_no, "code": "404", "error": f"No Order found with ORDER_NO: {order_no}"}
+
+        updated_count = sum(1 for result in results if result["code"] == "200")
+        response_json = encode_json({
+            "code": "200",
+            "data": results,
+            "message": f"{updated_count} of {len(items)} Orders/Invoices updated successfully"
+        })
+        return Response(response_json, content_type="application/json; charset=utf-8", status=200)
 
-def float_to_words(number_str):
-    if '.' in number_str:
-        integer_part, decimal_part = number_str.split('.')
-        integer_words = number_to_words(int(integer_part))
+    except Exception as e:
+        # Handle errors
+        response_json = encode_json({"error": str(e)})
+        return Response(response_json, content_type="application/json; charset=utf-8", status=500)
 
-        decimal_part = decimal_part[:2].ljust(2, '0')  # Ensure two digits
-        decimal_words = "ຈຸດ" + "".join([number_to_words(int(digit)) for digit in decimal_part])
+    finally:
+        if 'conn' in locals() and conn:
+            conn.close()
 
-        return integer_words + decimal_words
-    else:
-        return number_to_words(int(number_str))
+from flask import Flask, request, jsonify
 
-@app.route('/number-to-words', methods=['POST'])
-@token_required  # Add this line to protect the route
-# @app.route('/number-to-words', methods=['POST'])
-def convert_number_to_words():
-    data = request.get_json()
-    number_str = data.get('number')
 
-    if number_str is None:
-        return jsonify({"code": "400", "message": "Please provide a number"}), 400
+# Number-to-Lao conversion lives in lao_numbers (table-driven and memoized)
+from lao_numbers import float_to_words
 
+def convert_number_value(value):
+    """
+    Validate and convert one requested number.
+    Returns (number_str, words, None) on success or (number_str, None, error_message).
+    """
+    if value is None:
+        return None, None, "Please provide a number"
+
+    number_str = str(value)  # Keep it as a string to preserve format
     try:
-        number_str = str(number_str)  # Keep it as a string to preserve format
         number = float(number_str)  # Convert to float for validation
     except ValueError:
-        return jsonify({"code": "400", "message": "Invalid number provided"}), 400
+        return number_str, None, "Invalid number provided"
 
     if number < 0 or number >= 1000000000000:  # Check range
-        return jsonify({
-            "code": "400",
-            "message": "Number out of range. Please provide a number between 0 and 999,999,999,999"
-        }), 400
+        return number_str, None, "Number out of range. Please provide a number between 0 and 999,999,999,999"
+
+    try:
+        return number_str, float_to_words(number_str), None  # Convert number to words
+    except ValueError:
+        # e.g. "1e5" or "nan": accepted by float() but not a plain decimal amount
+        return number_str, None, "Invalid number provided"
+
+@app.route('/number-to-words', methods=['POST'])
+@token_required  # Add this line to protect the route
+# @app.route('/number-to-words', methods=['POST'])
+def convert_number_to_words():
+    data = request.get_json()
+    number_str, words, error = convert_number_value(data.get('number'))
 
-    words = float_to_words(number_str)  # Convert number to words
+    if error:
+        return jsonify({"code": "400", "message": error}), 400
 
     return jsonify({
         "code": "200",
@@ -1402,9 +2261,43 @@ def convert_number_to_words():
         "message": "success"
     })
 
+NUMBER_WORDS_BATCH_MAX = int(os.getenv("NUMBER_WORDS_BATCH_MAX", "10000"))
+
+@app.route('/numbers-to-words', methods=['POST'])
+@token_required
+def convert_numbers_to_words():
+    """
+    Convert many numbers in one request: {"numbers": [...]}.
+    Results come back in request order; invalid items carry their own error
+    instead of failing the whole batch. Conversions share the converter cache.
+    """
+    data = request.get_json()
+    numbers = data.get('numbers') if isinstance(data, dict) else None
+
+    if not isinstance(numbers, list) or not numbers:
+        return jsonify({"code": "400", "message": "Please provide a non-empty 'numbers' array"}), 400
+    if len(numbers) > NUMBER_WORDS_BATCH_MAX:
+        return jsonify({"code": "400", "message": f"Too many numbers in one request (maximum {NUMBER_WORDS_BATCH_MAX})"}), 400
+
+    results = []
+    failed = 0
+    for value in numbers:
+        number_str, words, error = convert_number_value(value)
+        if error:
+            failed += 1
+            results.append({"number": number_str, "code": "400", "message": error})
+        else:
+            results.append({"number": number_str, "words": words})
+
+    return jsonify({
+        "code": "200",
+        "data": results,
+        "message": "success" if not failed else f"{len(numbers) - failed} of {len(numbers)} numbers converted"
+    })
+
 # --- THIS IS THE CRUCIAL PART ---
 # Import and register your new expense blueprint
-from expenses_api import expenses_bp
+from expenses_api import expenses_bp, expense_status_cache
 app.register_blueprint(expenses_bp)
 # ----------------------------------
 
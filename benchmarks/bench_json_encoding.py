@@ -0,0 +1,101 @@
+"""
+Benchmark: response JSON encoding of /loadInvoices-shaped payloads.
+
+Compares the json.dumps(..., ensure_ascii=False) the routes used to call with
+the stdlib and orjson backends of json_encoder, after checking that all of
+them decode back to the same document.
+
+    python benchmarks/bench_json_encoding.py [invoices] [rounds]
+"""
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import json_encoder
+from datetime_format import format_datetime
+from lao_numbers import number_with_decimals_to_words
+
+LAO_NAMES = ["ບໍລິສັດ ລາວ-ໄທ ການຄ້າ ຈຳກັດ", "ທ້າວ ສົມສັກ ວົງສະຫວັນ", "ນາງ ບົວພັນ ແສງມະນີ",
+             "ຮ້ານ ສີສະຫວາດ ວັດສະດຸກໍ່ສ້າງ", "ບໍລິສັດ ນ້ຳດື່ມ ຫົວຂົວ"]
+LAO_ADDRESSES = ["ບ້ານ ສີສະຫວາດ, ເມືອງ ຈັນທະບູລີ, ນະຄອນຫຼວງວຽງຈັນ", "ບ້ານ ໂພນທັນ, ເມືອງ ໄຊເສດຖາ",
+                 "ບ້ານ ດົງໂດກ, ເມືອງ ໄຊທານີ"]
+LAO_PRODUCTS = ["ນ້ຳດື່ມ 600ml", "ເບຍລາວ ແກ້ວໃຫຍ່", "ເຂົ້າໜຽວ 1kg", "ປູນຊີມັງ", "ໄຂ່ໄກ່ 30 ໜ່ວຍ"]
+
+
+def make_invoice(rng, index, created):
+    details = []
+    sale_amt = 0.0
+    for line in range(rng.randint(1, 8)):
+        count = rng.randint(1, 20)
+        unit = round(rng.uniform(1000, 250000), 2)
+        amount = round(count * unit, 2)
+        sale_amt += amount
+        details.append({
+            "INV_DT_ID": index * 10 + line, "INV_NO": f"INV{index:08d}",
+            "PROD_CD": f"P{rng.randint(1, 9999):04d}", "PROD_NM": rng.choice(LAO_PRODUCTS),
+            "SALE_CNT": count, "UNIT_SALE": unit, "UNIT_SALE_AMT": amount,
+            "VAT_AMT": round(amount * 0.1, 2), "SALE_AMT": amount,
+        })
+    sale_amt = round(sale_amt, 2)
+    return {
+        "INV_NO": f"INV{index:08d}", "SALE_CNT": len(details), "SUPL_AMT": sale_amt,
+        "VAT_AMT": round(sale_amt * 0.1, 2), "SALE_AMT": sale_amt,
+        "SALE_AMT_WORD": number_with_decimals_to_words(sale_amt), "DISC_AMT": 0.0,
+        "CUST_TIN": str(rng.randint(10**8, 10**9)), "CUST_ID": f"C{rng.randint(1, 99999):05d}",
+        "CUST_FULL_NM": rng.choice(LAO_NAMES), "CUST_ADDR": rng.choice(LAO_ADDRESSES),
+        "CUST_TEL": f"020{rng.randint(10**7, 10**8 - 1)}", "CUST_ACCNO": None, "CUST_ACCNAM": None,
+        "PAY_TYPE": rng.choice(["cash", "transfer", "cheque"]), "ODER_NO": f"ORD{index:08d}",
+        "STATUS": "wait", "FAIL_REASON": None,
+        "CREATE_DATE": format_datetime(created),
+        "UPDATE_DATE": format_datetime(created),
+        "ORDER_TYPE": "insert", "INV_DETAIL": details,
+    }
+
+
+def legacy_encode(obj):
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def timed(encode, payload, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        body = encode(payload)
+    return (time.perf_counter() - start) / rounds, len(body)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    rng = random.Random(42)
+    start = datetime(2025, 1, 1, 8, 0, 0)
+    invoices = [make_invoice(rng, i, start + timedelta(minutes=i)) for i in range(count)]
+    payload = {"code": "200", "data": invoices, "next_cursor": None, "message": "Invoices loaded."}
+
+    encoders = [("json.dumps (before)", legacy_encode), ("stdlib backend", json_encoder._stdlib_encode)]
+    if json_encoder.orjson is not None:
+        encoders.append(("orjson backend", json_encoder._orjson_encode))
+    else:
+        print("orjson is not installed; timing the stdlib backend only")
+
+    expected = json.loads(legacy_encode(payload))
+    for name, encode in encoders:
+        if json.loads(encode(payload)) != expected:
+            print(f"MISMATCH: {name}")
+            sys.exit(1)
+
+    print(f"{count} invoices, active backend: {json_encoder.ENCODER_NAME}")
+    baseline = None
+    for name, encode in encoders:
+        seconds, size = timed(encode, payload, rounds)
+        baseline = baseline or seconds
+        print(f"{name:>20}: {seconds * 1000:8.2f} ms  {size / 1024:8.1f} KiB  x{baseline / seconds:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Benchmark: table-driven lao_numbers converters vs. the original recursive
+number_to_words / float_to_words that used to live in api.py.
+
+Converts the same set of random invoice amounts with both implementations,
+checks that every result is byte-identical, and prints the timings.
+
+    python benchmarks/bench_number_to_words.py [count]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import lao_numbers
+
+
+# --- Original implementation, copied verbatim from api.py ---
+def legacy_number_to_words(number):
+    units = ["", "ໜຶ່ງ", "ສອງ", "ສາມ", "ສີ່", "ຫ້າ", "ຫົກ", "ເຈັດ", "ແປດ", "ເກົ້າ"]
+    teens = ["ສິບ", "ສິບເອັດ", "ສິບສອງ", "ສິບສາມ", "ສິບສີ່", "ສິບຫ້າ", "ສິບຫົກ",
+             "ສິບເຈັດ", "ສິບແປດ", "ສິບເກົ້າ"]
+    tens = ["", "ສິບ", "ຊາວ", "ສາມສິບ", "ສີ່ສິບ", "ຫ້າສິບ", "ຫົກສິບ", "ເຈັດສິບ",
+            "ແປດສິບ", "ເກົ້າສິບ"]
+
+    if number == 0:
+        return "ສູນ"
+    elif number < 10:
+        return units[number]
+    elif 10 <= number < 20:
+        return teens[number - 10]
+    elif 20 <= number < 100:
+        if number % 10 == 1:
+            return tens[number // 10] + "ເອັດ"
+        else:
+            return tens[number // 10] + ("" + legacy_number_to_words(number % 10) if number % 10 != 0 else "")
+    elif 100 <= number < 1000:
+        hundreds_digit = number // 100
+        remainder = number % 100
+        if remainder == 0:
+            return units[hundreds_digit] + "ຮ້ອຍ"
+        else:
+            return units[hundreds_digit] + "ຮ້ອຍ" + legacy_number_to_words(remainder)
+    elif 1000 <= number < 100000:
+        thousands_part = number // 1000
+        remainder = number % 1000
+        thousands_word = legacy_number_to_words(thousands_part) + "ພັນ"
+        if remainder == 0:
+            return thousands_word
+        else:
+            return thousands_word + legacy_number_to_words(remainder)
+    elif 100000 <= number < 1000000:  # Fix for 100,000 to 999,999
+        hundred_thousands_part = number // 100000
+        remainder = number % 100000
+        hundred_thousands_word = legacy_number_to_words(hundred_thousands_part) + "ແສນ"
+        if remainder == 0:
+            return hundred_thousands_word
+        else:
+            return hundred_thousands_word + legacy_number_to_words(remainder)
+    elif 1000000 <= number < 1000000000:
+        millions_part = number // 1000000
+        remainder = number % 1000000
+        millions_word = legacy_number_to_words(millions_part) + "ລ້ານ"
+        if remainder == 0:
+            return millions_word
+        else:
+            return millions_word + legacy_number_to_words(remainder)
+    elif 1000000000 <= number < 1000000000000:
+        billions_part = number // 1000000000
+        remainder = number % 1000000000
+        billions_word = legacy_number_to_words(billions_part) + "ຕື້"
+        if remainder == 0:
+            return billions_word
+        else:
+            return billions_word + legacy_number_to_words(remainder)
+    else:
+        return "Number out of range"
+
+def legacy_float_to_words(number_str):
+    if '.' in number_str:
+        integer_part, decimal_part = number_str.split('.')
+        integer_words = legacy_number_to_words(int(integer_part))
+
+        decimal_part = decimal_part[:2].ljust(2, '0')  # Ensure two digits
+        decimal_words = "ຈຸດ" + "".join([legacy_number_to_words(int(digit)) for digit in decimal_part])
+
+        return integer_words + decimal_words
+    else:
+        return legacy_number_to_words(int(number_str))
+
+
+def make_amounts(count, seed=2024):
+    """Random amounts across the whole supported range, as the API receives them (strings)."""
+    rng = random.Random(seed)
+    amounts = []
+    for _ in range(count):
+        digits = rng.randint(1, 12)
+        integer = rng.randint(10 ** (digits - 1) if digits > 1 else 0, 10 ** digits - 1)
+        kind = rng.random()
+        if kind < 0.5:
+            amounts.append(str(integer))
+        elif kind < 0.8:
+            amounts.append(f"{integer}.{rng.randint(0, 99):02d}")
+        else:
+            amounts.append(f"{integer}.{rng.randint(0, 9)}")
+    return amounts
+
+
+def edge_numbers():
+    """Boundaries around every unit change, plus every number below 200,000."""
+    numbers = set(range(200_000))
+    for power in range(1, 13):
+        base = 10 ** power
+        numbers.update(range(max(0, base - 25), base + 25))
+        for lead in range(1, 10):
+            numbers.update((lead * base - 1, lead * base, lead * base + 1, lead * base + 11, lead * base + 21))
+    numbers.add(lao_numbers.MAX_NUMBER)
+    return sorted(n for n in numbers if n <= lao_numbers.MAX_NUMBER)
+
+
+def timed(func, values):
+    start = time.perf_counter()
+    results = [func(value) for value in values]
+    return time.perf_counter() - start, results
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    numbers = edge_numbers()
+    mismatches = [n for n in numbers if lao_numbers.number_to_words(n) != legacy_number_to_words(n)]
+    print(f"integers checked: {len(numbers):,}  mismatches: {len(mismatches)}")
+
+    amounts = make_amounts(count)
+
+    legacy_time, legacy_results = timed(legacy_float_to_words, amounts)
+
+    lao_numbers.number_to_words.cache_clear()
+    lao_numbers.float_to_words.cache_clear()
+    cold_time, new_results = timed(lao_numbers.float_to_words, amounts)
+    warm_time, _ = timed(lao_numbers.float_to_words, amounts)
+
+    mismatches = sum(1 for old, new in zip(legacy_results, new_results) if old != new)
+    print(f"amounts converted: {count:,}  mismatches: {mismatches}")
+    print(f"original recursive : {legacy_time:8.3f} s  ({legacy_time / count * 1e6:6.2f} us/amount)")
+    print(f"table-driven (cold): {cold_time:8.3f} s  ({cold_time / count * 1e6:6.2f} us/amount)  x{legacy_time / cold_time:.1f}")
+    print(f"table-driven (warm): {warm_time:8.3f} s  ({warm_time / count * 1e6:6.2f} us/amount)  x{legacy_time / warm_time:.1f}")
+    print(f"cache: {lao_numbers.cache_stats()}")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
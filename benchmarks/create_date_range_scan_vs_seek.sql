@@ -0,0 +1,122 @@
+-- Scan vs. seek for the /searchByDate date filter.
+--
+-- Builds two throwaway one-million-row copies of the TaxInv search columns in
+-- tempdb, indexed like migrations/001_create_date_indexes.sql:
+--   #TaxInvVarchar  create_date as varchar text in SQL Server's default style
+--                   ("Jan  2 2025  3:04PM"), the live column type before
+--                   migrations/004_taxinv_datetime2.sql
+--   #TaxInvDt2      create_date as datetime2(3), the column type after 004
+-- and runs the old and new predicates for the same one-week window on each.
+-- Run it in SSMS/sqlcmd and compare the "logical reads" and "elapsed time"
+-- lines in the Messages tab (or enable "Include Actual Execution Plan" to see
+-- Index Scan vs. Index Seek).
+--
+-- Expected: on the varchar column both predicates scan, because comparing it
+-- with a date parameter puts CONVERT_IMPLICIT on the column; only the
+-- half-open range on the datetime2 column seeks.
+--
+--   sqlcmd -S <server>,<port> -U <user> -P <password> -i benchmarks\create_date_range_scan_vs_seek.sql
+
+SET NOCOUNT ON;
+
+IF OBJECT_ID('tempdb..#TaxInvVarchar') IS NOT NULL DROP TABLE #TaxInvVarchar;
+IF OBJECT_ID('tempdb..#TaxInvDt2') IS NOT NULL DROP TABLE #TaxInvDt2;
+
+CREATE TABLE #TaxInvVarchar (
+    order_no      varchar(50)   NOT NULL PRIMARY KEY,
+    inv_no        varchar(50)   NULL,
+    status        varchar(20)   NOT NULL,
+    order_type    varchar(20)   NOT NULL,
+    fail_reason   nvarchar(255) NULL,
+    create_date   varchar(30)   NOT NULL,
+    update_date   varchar(30)   NOT NULL
+);
+
+CREATE TABLE #TaxInvDt2 (
+    order_no      varchar(50)   NOT NULL PRIMARY KEY,
+    inv_no        varchar(50)   NULL,
+    status        varchar(20)   NOT NULL,
+    order_type    varchar(20)   NOT NULL,
+    fail_reason   nvarchar(255) NULL,
+    create_date   datetime2(3)  NOT NULL,
+    update_date   datetime2(3)  NOT NULL
+);
+
+-- 1,000,000 rows spread evenly over roughly three years
+;WITH n AS (
+    SELECT TOP (1000000) ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS i
+    FROM sys.all_objects a CROSS JOIN sys.all_objects b CROSS JOIN sys.all_objects c
+)
+INSERT INTO #TaxInvDt2 (order_no, inv_no, status, order_type, fail_reason, create_date, update_date)
+SELECT
+    CONCAT('ORD', i),
+    CONCAT('INV', i),
+    CASE i % 4 WHEN 0 THEN 'wait' WHEN 1 THEN 'success' WHEN 2 THEN 'fail' ELSE 'cancel' END,
+    'insert',
+    NULL,
+    DATEADD(MINUTE, i, '2023-01-01'),
+    DATEADD(MINUTE, i + 1, '2023-01-01')
+FROM n;
+
+INSERT INTO #TaxInvVarchar (order_no, inv_no, status, order_type, fail_reason, create_date, update_date)
+SELECT order_no, inv_no, status, order_type, fail_reason,
+       CONVERT(varchar(30), create_date, 100),
+       CONVERT(varchar(30), update_date, 100)
+FROM #TaxInvDt2;
+
+CREATE NONCLUSTERED INDEX IX_TaxInvVarchar_create_date
+    ON #TaxInvVarchar (create_date, order_no)
+    INCLUDE (inv_no, status, order_type, fail_reason, update_date);
+
+CREATE NONCLUSTERED INDEX IX_TaxInvDt2_create_date
+    ON #TaxInvDt2 (create_date, order_no)
+    INCLUDE (inv_no, status, order_type, fail_reason, update_date);
+
+-- Typed like the parameters pyodbc binds for date_range_bounds()
+DECLARE @start datetime2(3) = '2024-06-01', @end datetime2(3) = '2024-06-07';
+DECLARE @rows int;
+
+-- Warm the cache so every run reads from memory
+SELECT @rows = COUNT(*) FROM #TaxInvVarchar;
+SELECT @rows = COUNT(*) FROM #TaxInvDt2;
+
+SET STATISTICS IO ON;
+SET STATISTICS TIME ON;
+
+PRINT '--- varchar column, old predicate: CAST(create_date AS DATE) BETWEEN @start AND @end ---';
+SELECT @rows = COUNT(*) FROM (
+    SELECT inv_no, order_no, status, order_type, fail_reason, create_date, update_date
+    FROM #TaxInvVarchar
+    WHERE CAST(create_date AS DATE) BETWEEN @start AND @end
+) AS old_query;
+PRINT CONCAT('rows: ', @rows);
+
+PRINT '--- varchar column, new predicate: create_date >= @start AND create_date < @end + 1 day ---';
+SELECT @rows = COUNT(*) FROM (
+    SELECT inv_no, order_no, status, order_type, fail_reason, create_date, update_date
+    FROM #TaxInvVarchar
+    WHERE create_date >= @start AND create_date < DATEADD(DAY, 1, @end)
+) AS new_query;
+PRINT CONCAT('rows: ', @rows);
+
+PRINT '--- datetime2 column (after migration 004), old predicate ---';
+SELECT @rows = COUNT(*) FROM (
+    SELECT inv_no, order_no, status, order_type, fail_reason, create_date, update_date
+    FROM #TaxInvDt2
+    WHERE CAST(create_date AS DATE) BETWEEN @start AND @end
+) AS old_query;
+PRINT CONCAT('rows: ', @rows);
+
+PRINT '--- datetime2 column (after migration 004), new predicate ---';
+SELECT @rows = COUNT(*) FROM (
+    SELECT inv_no, order_no, status, order_type, fail_reason, create_date, update_date
+    FROM #TaxInvDt2
+    WHERE create_date >= @start AND create_date < DATEADD(DAY, 1, @end)
+) AS new_query;
+PRINT CONCAT('rows: ', @rows);
+
+SET STATISTICS TIME OFF;
+SET STATISTICS IO OFF;
+
+DROP TABLE #TaxInvVarchar;
+DROP TABLE #TaxInvDt2;
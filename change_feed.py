@@ -0,0 +1,51 @@
+import threading
+
+
+class ChangeNotifier:
+    """
+    In-process "something changed" signal for long-poll endpoints.
+
+    Writers call notify() after committing; readers remember `version` before
+    querying and then wait() for it to move. Waiting never holds a database
+    connection, and the number of simultaneous waiters is capped so long polls
+    cannot occupy every server thread.
+    """
+
+    def __init__(self, max_waiters=2):
+        self.max_waiters = max_waiters
+        self._cond = threading.Condition()
+        self._version = 0
+        self._waiters = 0
+
+    @property
+    def version(self):
+        with self._cond:
+            return self._version
+
+    def notify(self):
+        """Wake every waiter; call after the change has been committed."""
+        with self._cond:
+            self._version += 1
+            self._cond.notify_all()
+
+    def wait(self, seen_version, timeout):
+        """
+        Block until version differs from seen_version or timeout seconds pass.
+        Returns True if a change was signalled, False on timeout, and None
+        (immediately) when the waiter limit has been reached; callers should then
+        tell the client to retry later rather than answer as if nothing changed.
+        """
+        with self._cond:
+            if self._version != seen_version:
+                return True
+            if self._waiters >= self.max_waiters:
+                return None
+            self._waiters += 1
+            try:
+                return self._cond.wait_for(lambda: self._version != seen_version, timeout)
+            finally:
+                self._waiters -= 1
+
+    def stats(self):
+        with self._cond:
+            return {"version": self._version, "waiters": self._waiters, "max_waiters": self.max_waiters}
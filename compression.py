@@ -0,0 +1,131 @@
+import os
+import threading
+import zlib
+
+from flask import request
+
+# Negotiated gzip/deflate compression of responses.
+# Buffered bodies are compressed when they reach COMPRESSION_MIN_SIZE bytes;
+# streamed (?stream=1) bodies are always compressed, chunk by chunk, with a
+# sync flush after each chunk so the client keeps receiving data as it is
+# produced.
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "1").lower() in ("1", "true", "yes")
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", "6"))
+
+# Preference order when the client accepts both at the same quality
+ENCODINGS = ("gzip", "deflate")
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+_WBITS = {
+    "gzip": 16 + zlib.MAX_WBITS,  # gzip header and trailer
+    "deflate": zlib.MAX_WBITS,    # zlib stream, which is what HTTP calls "deflate"
+}
+
+
+class ResponseCompressor:
+    """after_request hook that compresses responses and counts the bytes saved."""
+
+    def __init__(self, min_size=1024, level=6):
+        self.min_size = min_size
+        self.level = level
+        self._lock = threading.Lock()
+        self._stats = {encoding: {"responses": 0, "bytes_in": 0, "bytes_out": 0} for encoding in ENCODINGS}
+        self._skipped_small = 0
+
+    def init_app(self, app):
+        app.after_request(self.compress_response)
+
+    def _record(self, encoding, bytes_in, bytes_out):
+        with self._lock:
+            stats = self._stats[encoding]
+            stats["responses"] += 1
+            stats["bytes_in"] += bytes_in
+            stats["bytes_out"] += bytes_out
+
+    def _compressor(self, encoding):
+        return zlib.compressobj(self.level, zlib.DEFLATED, _WBITS[encoding])
+
+    def compress_response(self, response):
+        if (response.status_code < 200 or response.status_code in (204, 304)
+                or request.method == "HEAD"
+                or response.direct_passthrough
+                or "Content-Encoding" in response.headers
+                or not response.mimetype.startswith(COMPRESSIBLE_TYPES)):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = request.accept_encodings.best_match(ENCODINGS)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = _CompressedStream(response.response, self._compressor(encoding),
+                                                  lambda bytes_in, bytes_out: self._record(encoding, bytes_in, bytes_out))
+            response.headers.pop("Content-Length", None)
+        else:
+            body = response.get_data()
+            if len(body) < self.min_size:
+                with self._lock:
+                    self._skipped_small += 1
+                return response
+            compressor = self._compressor(encoding)
+            compressed = compressor.compress(body) + compressor.flush()
+            self._record(encoding, len(body), len(compressed))
+            response.set_data(compressed)
+
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+    def stats(self):
+        with self._lock:
+            encodings = {encoding: dict(values) for encoding, values in self._stats.items()}
+            skipped_small = self._skipped_small
+        bytes_in = sum(values["bytes_in"] for values in encodings.values())
+        bytes_out = sum(values["bytes_out"] for values in encodings.values())
+        return {
+            "enabled": COMPRESSION_ENABLED,
+            "min_size": self.min_size,
+            "level": self.level,
+            "encodings": encodings,
+            "skipped_below_min_size": skipped_small,
+            "bytes_in": bytes_in,
+            "bytes_out": bytes_out,
+            "bytes_saved": bytes_in - bytes_out,
+            "ratio": round(bytes_out / bytes_in, 4) if bytes_in else None,
+        }
+
+
+class _CompressedStream:
+    """
+    Compresses a streamed body chunk by chunk. close() is passed on to the
+    wrapped body even if iteration never started, so its cleanup (e.g.
+    returning a DB connection) always runs.
+    """
+
+    def __init__(self, chunks, compressor, on_finish):
+        self._chunks = chunks
+        self._compressor = compressor
+        self._on_finish = on_finish
+
+    def __iter__(self):
+        bytes_in = bytes_out = 0
+        for chunk in self._chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            bytes_in += len(chunk)
+            data = self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            bytes_out += len(data)
+            yield data
+        data = self._compressor.flush()
+        bytes_out += len(data)
+        yield data
+        self._on_finish(bytes_in, bytes_out)
+
+    def close(self):
+        close = getattr(self._chunks, "close", None)
+        if close is not None:
+            close()
+
+
+compressor = ResponseCompressor(min_size=COMPRESSION_MIN_SIZE, level=COMPRESSION_LEVEL)
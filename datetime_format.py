@@ -0,0 +1,76 @@
+from datetime import datetime
+from functools import lru_cache
+
+# Date formatting for JSON output.
+# TaxInv dates used to be varchar columns that pyodbc returns as text in SQL
+# Server's default style ("Jan  2 2025  3:04PM"); after
+# migrations/004_taxinv_datetime2.sql they come back as native datetimes.
+# format_db_datetime() accepts either and renders the API's dd/mm/YYYY format.
+# /loadInvoices has always returned the stored text as is; format_legacy_datetime()
+# keeps that output the same for datetime2 values.
+
+API_DATETIME_FORMAT = "%d/%m/%Y %H:%M:%S"
+LEGACY_DATETIME_FORMAT = "%b %d %Y %I:%M%p"
+
+_TWO_DIGITS = tuple(f"{n:02d}" for n in range(60))
+
+
+@lru_cache(maxsize=4096)
+def _date_prefix(year, month, day):
+    return f"{day:02d}/{month:02d}/{year:04d} "
+
+
+def format_datetime(value):
+    """Format a datetime as dd/mm/YYYY HH:MM:SS (same as strftime(API_DATETIME_FORMAT), faster)."""
+    return f"{_date_prefix(value.year, value.month, value.day)}" \
+           f"{_TWO_DIGITS[value.hour]}:{_TWO_DIGITS[value.minute]}:{_TWO_DIGITS[value.second]}"
+
+
+@lru_cache(maxsize=65536)
+def _format_legacy_text(text):
+    # Legacy values only have minute precision, so the same text repeats across rows
+    for fmt in (LEGACY_DATETIME_FORMAT, None):
+        try:
+            parsed = datetime.strptime(text, fmt) if fmt else datetime.fromisoformat(text.strip())
+        except ValueError:
+            continue
+        return format_datetime(parsed)
+    return text
+
+
+def format_db_datetime(value):
+    """
+    Format a date column value for a response: native datetimes directly,
+    legacy varchar text by parsing it first. None stays None, and text that
+    is not a recognisable date is returned unchanged.
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return format_datetime(value)
+    return _format_legacy_text(value)
+
+
+_MONTH_ABBR = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def format_legacy_datetime(value):
+    """
+    Render a date column the way the legacy varchar column stored it (SQL Server
+    style 100, "Jan  2 2025  3:04PM"): text is returned unchanged, native
+    datetimes are formatted into that shape. None stays None.
+    """
+    if not isinstance(value, datetime):
+        return value
+    hour = value.hour % 12 or 12
+    return f"{_MONTH_ABBR[value.month - 1]} {value.day:>2} {value.year:04d} " \
+           f"{hour:>2}:{_TWO_DIGITS[value.minute]}{'PM' if value.hour >= 12 else 'AM'}"
+
+
+def cache_stats():
+    """Hit/miss counters of the memoized formatters."""
+    stats = {}
+    for name, func in (("date_prefix", _date_prefix), ("legacy_text", _format_legacy_text)):
+        info = func.cache_info()
+        stats[name] = {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
+    return stats
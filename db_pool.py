@@ -0,0 +1,302 @@
+import threading
+import time
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection becomes available in time."""
+
+
+class PooledConnection:
+    """
+    Thin proxy around a raw pyodbc connection handed out by ConnectionPool.
+    Everything is delegated to the real connection except close(), which
+    returns the connection to the pool instead of logging out of the server,
+    so existing `finally: conn.close()` blocks keep working unchanged.
+    Attributes set on the proxy (conn.autocommit, conn.timeout, ...) are set on
+    the real connection and put back to their old values on release, so they
+    never leak to the next borrower.
+    """
+
+    _OWN_ATTRIBUTES = frozenset(("_pool", "_entry", "_saved"))
+
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+        self._saved = {}
+
+    def __getattr__(self, name):
+        entry = self.__dict__.get("_entry")
+        if entry is None:
+            raise AttributeError(f"Connection already returned to the pool (accessing '{name}')")
+        return getattr(entry.raw, name)
+
+    def __setattr__(self, name, value):
+        if name in self._OWN_ATTRIBUTES:
+            object.__setattr__(self, name, value)
+            return
+        entry = self._entry
+        if entry is None:
+            raise AttributeError(f"Connection already returned to the pool (setting '{name}')")
+        if name not in self._saved:
+            self._saved[name] = getattr(entry.raw, name)
+        setattr(entry.raw, name, value)
+
+    def cursor(self):
+        """New cursor on the underlying connection, passed through the pool's cursor_wrapper."""
+        cursor = self.__getattr__("cursor")()
+        wrap = self._pool.cursor_wrapper
+        return wrap(cursor) if wrap is not None else cursor
+
+    @property
+    def raw(self):
+        """The underlying pyodbc connection."""
+        return self._entry.raw
+
+    def discard(self):
+        """Close the underlying connection for good instead of pooling it."""
+        if self._entry is not None:
+            entry, self._entry = self._entry, None
+            self._pool._release(entry, discard=True)
+
+    def close(self):
+        """Return the connection to the pool (safe to call more than once)."""
+        if self._entry is not None:
+            entry, self._entry = self._entry, None
+            discard = False
+            try:
+                for name, value in self._saved.items():
+                    setattr(entry.raw, name, value)
+            except Exception:
+                discard = True
+            self._pool._release(entry, discard=discard)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class _PoolEntry:
+    __slots__ = ("raw", "created_at", "last_used")
+
+    def __init__(self, raw):
+        now = time.monotonic()
+        self.raw = raw
+        self.created_at = now
+        self.last_used = now
+
+
+class ConnectionPool:
+    """
+    Bounded pool of database connections.
+
+    - min_size:         idle connections kept warm even past idle_timeout
+                        (opened up front by warm(), otherwise on first use)
+    - max_size:         hard cap on open connections (idle + checked out)
+    - idle_timeout:     seconds an idle connection may sit before it is closed
+    - max_lifetime:     seconds after which a connection is retired on release
+    - checkout_timeout: seconds to wait for a free connection before giving up
+    - ping_interval:    connections idle longer than this are checked with
+                        `SELECT 1` on checkout (0 = check on every checkout)
+    - cursor_wrapper:   optional callable applied to every cursor handed out
+                        by conn.cursor() (e.g. to time queries)
+    """
+
+    def __init__(self, connect, min_size=1, max_size=10, idle_timeout=300,
+                 max_lifetime=1800, checkout_timeout=30, ping_interval=5, cursor_wrapper=None):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        if min_size < 0 or min_size > max_size:
+            raise ValueError("min_size must be between 0 and max_size")
+
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.checkout_timeout = checkout_timeout
+        self.ping_interval = ping_interval
+        self.cursor_wrapper = cursor_wrapper
+
+        self._lock = threading.Condition()
+        self._idle = []  # LIFO stack of _PoolEntry, most recently used last
+        self._open = 0  # idle + checked out + being created
+        self._checked_out = 0
+        self._waiting = 0
+        self._created = 0
+        self._discarded = 0
+        self._checkouts = 0
+        self._timeouts = 0
+
+    # --- Checkout ---
+    def get(self):
+        """Check out a live connection, opening a new one if the pool has room."""
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            entry = None
+            create = False
+            with self._lock:
+                self._reap_idle_locked()
+                while not self._idle and self._open >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            f"Timed out after {self.checkout_timeout}s waiting for a database connection "
+                            f"(pool max_size={self.max_size})"
+                        )
+                    self._waiting += 1
+                    try:
+                        self._lock.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                if self._idle:
+                    entry = self._idle.pop()
+                else:
+                    self._open += 1
+                    create = True
+                self._checked_out += 1
+
+            if create:
+                try:
+                    entry = _PoolEntry(self._connect())
+                except Exception:
+                    with self._lock:
+                        self._open -= 1
+                        self._checked_out -= 1
+                        self._lock.notify()
+                    raise
+                with self._lock:
+                    self._created += 1
+                    self._checkouts += 1
+                return PooledConnection(self, entry)
+
+            if self._is_alive(entry):
+                entry.last_used = time.monotonic()
+                with self._lock:
+                    self._checkouts += 1
+                return PooledConnection(self, entry)
+
+            # Stale connection: drop it and try again with the same deadline
+            self._close_raw(entry)
+            with self._lock:
+                self._open -= 1
+                self._checked_out -= 1
+                self._discarded += 1
+                self._lock.notify()
+
+    def warm(self):
+        """
+        Open connections until min_size are open, so the first requests do not
+        pay for the login. Returns how many were opened; a failed connect is
+        raised after the slots reserved for the rest are given back.
+        """
+        with self._lock:
+            wanted = max(0, self.min_size - self._open)
+            self._open += wanted
+        opened = 0
+        try:
+            for _ in range(wanted):
+                entry = _PoolEntry(self._connect())
+                with self._lock:
+                    self._idle.append(entry)
+                    self._created += 1
+                    self._lock.notify()
+                opened += 1
+        finally:
+            if opened < wanted:
+                with self._lock:
+                    self._open -= wanted - opened
+                    self._lock.notify_all()
+        return opened
+
+    def _is_alive(self, entry):
+        now = time.monotonic()
+        if self.max_lifetime and now - entry.created_at >= self.max_lifetime:
+            return False
+        if now - entry.last_used < self.ping_interval:
+            return True
+        try:
+            cursor = entry.raw.cursor()
+            try:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+            finally:
+                cursor.close()
+            return True
+        except Exception:
+            return False
+
+    # --- Release ---
+    def _release(self, entry, discard=False):
+        if not discard:
+            try:
+                # Never hand the next caller a half-finished transaction
+                entry.raw.rollback()
+            except Exception:
+                discard = True
+        now = time.monotonic()
+        if self.max_lifetime and now - entry.created_at >= self.max_lifetime:
+            discard = True
+
+        with self._lock:
+            self._checked_out -= 1
+            if discard:
+                self._open -= 1
+                self._discarded += 1
+            else:
+                entry.last_used = now
+                self._idle.append(entry)
+            self._lock.notify()
+
+        if discard:
+            self._close_raw(entry)
+
+    def _reap_idle_locked(self):
+        """Close idle connections past idle_timeout, keeping min_size warm. Caller holds the lock."""
+        if not self.idle_timeout or len(self._idle) <= self.min_size:
+            return
+        cutoff = time.monotonic() - self.idle_timeout
+        # Oldest entries sit at the bottom of the LIFO stack
+        expired = []
+        while len(self._idle) > self.min_size and self._idle[0].last_used < cutoff:
+            expired.append(self._idle.pop(0))
+        if expired:
+            self._open -= len(expired)
+            self._discarded += len(expired)
+            for entry in expired:
+                self._close_raw(entry)
+
+    @staticmethod
+    def _close_raw(entry):
+        try:
+            entry.raw.close()
+        except Exception:
+            pass
+
+    # --- Lifecycle and metrics ---
+    def close_all(self):
+        """Close every idle connection; checked-out ones are closed when released."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._discarded += len(idle)
+        for entry in idle:
+            self._close_raw(entry)
+
+    def stats(self):
+        """Snapshot of pool gauges and counters."""
+        with self._lock:
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "open": self._open,
+                "idle": len(self._idle),
+                "checked_out": self._checked_out,
+                "waiting": self._waiting,
+                "created": self._created,
+                "discarded": self._discarded,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+            }
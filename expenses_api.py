@@ -1,9 +1,14 @@
 from flask import Blueprint, request, Response, jsonify
 import json
+import os
 import pyodbc
 from decimal import Decimal, InvalidOperation # <--- AND THIS LINE
 # Import the shared functions we just created
-from shared_utils import get_db_connection, token_required, generate_signature, clean_string
+from json_encoder import encode_json
+from ttl_cache import TTLCache
+from shared_utils import get_db_connection, token_required, generate_signature, clean_string, \
+    stream_requested, iter_cursor_rows, stream_json_response, STREAM_FETCH_SIZE, execute_many, date_range_bounds, \
+    result_set_etag, etag_matches, not_modified_response
 
 # 2. Create your new expense endpoints using the blueprint decorator
 # 1. Create a Blueprint object for all expense-related endpoints.
@@ -82,6 +87,31 @@ def upload_expense():
                 }
             }), 400
 
+        # Build the 'tbl_dr' and 'tbl_cr' rows up front so they can be inserted in one batch each
+        dr_rows = []
+        for item in debit_entries:
+            # Validate that each debit item has the required keys
+            if not isinstance(item, dict) or not all(k in item for k in ['dr_ac', 'dr_amt']):
+                return jsonify({"error": "A debit entry is missing a required field (dr_ac, or dr_amt)"}), 400
+
+            exp_id = clean_string(item.get('exp_id'))
+            dr_ac = clean_string(item.get('dr_ac'))
+            dr_amt = Decimal(str(item.get('dr_amt', '0')).replace(',', ''))
+
+            dr_rows.append((exp_no, exp_id, dr_ac, dr_amt))
+
+        cr_rows = []
+        for item in credit_entries:
+            # Validate that each credit item has the required keys
+            if not isinstance(item, dict) or not all(k in item for k in ['cr_ac', 'cr_amt']):
+                return jsonify({"error": "A credit entry is missing a required field (cr_ac, or cr_amt)"}), 400
+
+            exp_id = clean_string(item.get('exp_id'))
+            cr_ac = clean_string(item.get('cr_ac'))
+            cr_amt = Decimal(str(item.get('cr_amt', '0')).replace(',', ''))
+
+            cr_rows.append((exp_no, exp_id, cr_ac, cr_amt))
+
         # --- 5. Database Operations ---
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -95,36 +125,13 @@ def upload_expense():
         """
         cursor.execute(expense_query, exp_no, exp_desc)
 
-        # Insert into 'tbl_dr'
+        # Insert into 'tbl_dr' (one round trip for all debit legs)
         dr_query = "INSERT INTO tbl_dr (exp_no, exp_id, dr_ac, dr_amt) VALUES (?, ?, ?, ?)"
-        for item in debit_entries:
-            # Validate that each debit item has the required keys
-            if not all(k in item for k in ['dr_ac', 'dr_amt']):
-                conn.rollback() # Important: undo the main insert if child data is bad
-                return jsonify({"error": "A debit entry is missing a required field (dr_ac, or dr_amt)"}), 400
-            
-        
-            exp_id = clean_string(item.get('exp_id'))
-            dr_ac = clean_string(item.get('dr_ac'))
-            dr_amt = Decimal(str(item.get('dr_amt', '0')).replace(',', ''))
-            
-            dr_params = (exp_no, exp_id, dr_ac, dr_amt)
-            cursor.execute(dr_query, dr_params)
-        
-        # Insert into 'tbl_cr'
-        cr_query = "INSERT INTO tbl_cr (exp_no, exp_id, cr_ac, cr_amt) VALUES (?, ?, ?, ?)"
-        for item in credit_entries:
-            # Validate that each credit item has the required keys
-            if not all(k in item for k in ['cr_ac', 'cr_amt']):
-                conn.rollback() # Important: undo all previous inserts
-                return jsonify({"error": "A credit entry is missing a required field (cr_ac, or cr_amt)"}), 400
-
-            exp_id = clean_string(item.get('exp_id'))
-            cr_ac = clean_string(item.get('cr_ac'))
-            cr_amt = Decimal(str(item.get('cr_amt', '0')).replace(',', ''))
+        execute_many(cursor, dr_query, dr_rows)
 
-            cr_params = (exp_no, exp_id, cr_ac, cr_amt)
-            cursor.execute(cr_query, cr_params)
+        # Insert into 'tbl_cr' (one round trip for all credit legs)
+        cr_query = "INSERT INTO tbl_cr (exp_no, exp_id, cr_ac, cr_amt) VALUES (?, ?, ?, ?)"
+        execute_many(cursor, cr_query, cr_rows)
 
         # If all inserts were successful, commit the transaction
         conn.commit()
@@ -156,6 +163,24 @@ def upload_expense():
             conn.close()
 
 
+# --- Final status cache ---
+# Same scheme as invoice_status_cache in api.py: expenses that reached 'success'
+# or 'cancel' are served from memory by /getStatus. cancel_expense invalidates
+# in this process; STATUS_CACHE_TTL bounds staleness from other writers.
+TERMINAL_EXPENSE_STATUSES = frozenset(("success", "cancel"))
+
+expense_status_cache = TTLCache(
+    max_entries=int(os.getenv("STATUS_CACHE_MAX_ENTRIES", "10000")),
+    max_bytes=int(os.getenv("STATUS_CACHE_MAX_BYTES", str(4 * 1024 * 1024))),
+    ttl=float(os.getenv("STATUS_CACHE_TTL", "300")),
+    sizeof=lambda value: len(encode_json(value)),
+)
+
+def expense_cache_key(exp_no):
+    """Key an exp_no like the column collation: case and trailing spaces ignored, leading ones not."""
+    return str(exp_no).rstrip().casefold()
+
+
 @expenses_bp.route('/getStatus', methods=['POST'])
 @token_required
 def get_expense_status():
@@ -188,7 +213,16 @@ def get_expense_status():
         if client_signature != server_signature:
             return jsonify({"error": "Invalid signature"}), 400
 
-        # --- 3. Database Query ---
+        # --- 3. Database Query (skipped for cached final statuses) ---
+        result = expense_status_cache.get(expense_cache_key(exp_no))
+        if result is not None:
+            return jsonify({
+                "code": "200",
+                "data": result,
+                "message": "Expense status retrieved successfully"
+            }), 200
+        cache_generation = expense_status_cache.generation
+
         conn = get_db_connection()
         cursor = conn.cursor()
 
@@ -219,6 +253,8 @@ def get_expense_status():
             "create_date": expense_record.create_date,
             "update_date": expense_record.update_date
         }
+        if result["status"] in TERMINAL_EXPENSE_STATUSES:
+            expense_status_cache.put(expense_cache_key(exp_no), result, cache_generation)
 
         return jsonify({
             "code": "200",
@@ -273,37 +309,37 @@ def cancel_expense():
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        # First, check if the expense exists and what its current status is
-        check_query = "SELECT status FROM expense WHERE exp_no = ?"
-        cursor.execute(check_query, exp_no)
-        expense_record = cursor.fetchone()
-
-        # Handle "Not Found" case
-        if not expense_record:
-            return jsonify({"error": f"No expense found with exp_no '{exp_no}'."}), 404
-
-        # Prevent re-cancelling an already cancelled expense
-        if expense_record.status == 'cancel':
-            return jsonify({"error": f"Expense with exp_no '{exp_no}' is already canceled."}), 400 # 400 Bad Request is appropriate here
-
-        # Prevent cancelling an expense that has already been processed successfully
-        if expense_record.status == 'success':
-             return jsonify({"error": f"Cannot cancel expense with exp_no '{exp_no}' because it has already succeeded."}), 400
-
-        # Update the expense status to 'cancel' and set the update_date
+        # Check and cancel in one conditional UPDATE; OUTPUT returns the new status,
+        # so there is no separate check/re-read and no race in between
         cancel_query = """
             UPDATE expense
             SET status = 'cancel', update_date = GETDATE()
-            WHERE exp_no = ?
+            OUTPUT INSERTED.status
+            WHERE exp_no = ? AND (status IS NULL OR status NOT IN ('cancel', 'success'))
         """
         cursor.execute(cancel_query, exp_no)
-        conn.commit()
-
-        # --- 4. Fetch the updated record for the response ---
-        # (This confirms the update was successful)
-        cursor.execute(check_query, exp_no) # Re-run the check query
         updated_expense = cursor.fetchone()
 
+        if not updated_expense:
+            # Nothing was updated: find out why (only on this error path)
+            conn.rollback()
+            cursor.execute("SELECT status FROM expense WHERE exp_no = ?", exp_no)
+            expense_record = cursor.fetchone()
+
+            # Handle "Not Found" case
+            if not expense_record:
+                return jsonify({"error": f"No expense found with exp_no '{exp_no}'."}), 404
+
+            # Prevent re-cancelling an already cancelled expense
+            if expense_record.status == 'cancel':
+                return jsonify({"error": f"Expense with exp_no '{exp_no}' is already canceled."}), 400 # 400 Bad Request is appropriate here
+
+            # Prevent cancelling an expense that has already been processed successfully
+            return jsonify({"error": f"Cannot cancel expense with exp_no '{exp_no}' because it has already succeeded."}), 400
+
+        conn.commit()
+        expense_status_cache.invalidate(expense_cache_key(exp_no))
+
         # --- 5. Format and Return Success Response ---
         result = {
             "exp_no": exp_no,
@@ -370,19 +406,26 @@ def search_expense_by_date():
         if client_signature != server_signature:
             return jsonify({"error": "Invalid signature"}), 400
 
+        # Expected format: 'YYYY-MM-DD'; endDate is inclusive
+        try:
+            range_start, range_end = date_range_bounds(start_date_str, end_date_str)
+        except (ValueError, AttributeError):
+            return jsonify({"error": "Invalid date format for startDate or endDate. Expected YYYY-MM-DD"}), 400
+
         # --- 3. Database Query ---
         conn = get_db_connection()
         cursor = conn.cursor()
 
         # Query to fetch records within the date range.
-        # We CAST create_date to DATE to ignore the time part for the comparison.
+        # A half-open range on the raw create_date (no CAST). expense.create_date is a
+        # native datetime, so this can seek IX_expense_create_date.
         query = """
             SELECT exp_no, status, fail_reason, create_date, update_date
             FROM expense
-            WHERE CAST(create_date AS DATE) BETWEEN ? AND ?
+            WHERE create_date >= ? AND create_date < ?
             ORDER BY create_date ASC
         """
-        cursor.execute(query, (start_date_str, end_date_str))
+        cursor.execute(query, (range_start, range_end))
         records = cursor.fetchall()
 
         # --- 4. Handle "No Records Found" Case ---
@@ -419,12 +462,33 @@ def search_expense_by_date():
 
 # ... (existing imports and other functions are above this) ...
 
+def expense_record_to_dict(record):
+    """Map an expense row to its /retrieve JSON shape."""
+    return {
+        "exp_no": record.exp_no,
+        "status": record.status,
+        "fail_reason": record.fail_reason or "", # Ensure this is always present
+        "create_date": record.create_date,
+        "update_date": record.update_date
+    }
+
+# The expense table has no rowversion column, so the /retrieve version also
+# checksums the listed columns: an update that leaves update_date alone still
+# changes the ETag.
+RETRIEVE_VERSION_QUERY = """
+    SELECT COUNT_BIG(*) AS row_count, MAX(update_date) AS max_update_date,
+           CHECKSUM_AGG(BINARY_CHECKSUM(exp_no, status, fail_reason, create_date, update_date)) AS row_checksum
+    FROM expense
+    WHERE status = ?
+"""
+
 @expenses_bp.route('/retrieve', methods=['GET'])
 @token_required
 def retrieve_expenses():
     """
     Retrieves all expense records that match a given status.
     The status is provided in the JSON request body.
+    Answers 304 Not Modified when If-None-Match still matches the set's ETag.
     """
     conn = None
     try:
@@ -472,6 +536,12 @@ def retrieve_expenses():
         conn = get_db_connection()
         cursor = conn.cursor()
 
+        # Answer 304 before fetching anything when the client's copy is current
+        etag, _ = result_set_etag(cursor, RETRIEVE_VERSION_QUERY, (status_to_retrieve,),
+                                  status_to_retrieve, stream_requested())
+        if etag_matches(etag):
+            return not_modified_response(etag)
+
         # Query to fetch records matching the specified status
         query = """
             SELECT exp_no, status, fail_reason, create_date, update_date
@@ -480,32 +550,40 @@ def retrieve_expenses():
             ORDER BY create_date ASC
         """
         cursor.execute(query, status_to_retrieve)
-        records = cursor.fetchall()
+        records = cursor.fetchmany(STREAM_FETCH_SIZE) if stream_requested() else cursor.fetchall()
 
         # --- 4. Handle "No Records Found" Case ---
         if not records:
-            return jsonify({
+            response = jsonify({
                 "code": "200",
                 "data": [], # Return an empty list
                 "message": f"No expense records found with status '{status_to_retrieve}'."
-            }), 200
+            })
+            response.set_etag(etag, weak=True)
+            return response, 200
 
         # --- 5. Format and Return Success Response ---
-        result_list = []
-        for record in records:
-            result_list.append({
-                "exp_no": record.exp_no,
-                "status": record.status,
-                "fail_reason": record.fail_reason or "", # Ensure this is always present
-                "create_date": record.create_date,
-                "update_date": record.update_date
-            })
+        message = f"Expense records with status '{status_to_retrieve}' retrieved successfully."
 
-        return jsonify({
+        if stream_requested():
+            response = stream_json_response(
+                conn,
+                (expense_record_to_dict(record) for record in iter_cursor_rows(cursor, records)),
+                envelope={"code": "200", "message": message}
+            )
+            conn = None  # Closed by the streamed response once the body is sent
+            response.set_etag(etag, weak=True)
+            return response
+
+        result_list = [expense_record_to_dict(record) for record in records]
+
+        response = jsonify({
             "code": "200",
             "data": result_list,
-            "message": f"Expense records with status '{status_to_retrieve}' retrieved successfully."
-        }), 200
+            "message": message
+        })
+        response.set_etag(etag, weak=True)
+        return response, 200
 
     except Exception as e:
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
@@ -0,0 +1,126 @@
+import json
+import os
+from time import perf_counter
+from datetime import datetime, date, time
+from decimal import Decimal
+
+from datetime_format import format_datetime
+from metrics import record_serialization_time
+
+try:
+    from flask.json.provider import DefaultJSONProvider
+    from werkzeug.http import http_date
+except ImportError:  # lets the encoder be imported (and benchmarked) without Flask
+    DefaultJSONProvider = object
+    http_date = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Response JSON encoding in one place.
+# JSON_ENCODER selects the backend: "auto" (orjson when installed, else the
+# standard library), "orjson" or "stdlib". Both produce compact UTF-8 JSON and
+# handle the datetime/Decimal values that come straight out of pyodbc rows.
+# Decimal is written as a string so money keeps its exact digits.
+JSON_ENCODER = os.getenv("JSON_ENCODER", "auto").lower()
+
+DATE_FORMAT = "%d/%m/%Y"
+
+
+def encode_default(obj):
+    """Serialize the non-JSON types returned by pyodbc."""
+    if isinstance(obj, datetime):
+        return format_datetime(obj)
+    if isinstance(obj, date):
+        return obj.strftime(DATE_FORMAT)
+    if isinstance(obj, time):
+        return obj.strftime("%H:%M:%S")
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (bytes, bytearray)):
+        return obj.hex()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def jsonify_default(obj):
+    """
+    Like encode_default(), but keeps the RFC 822 dates Flask's default provider
+    gave jsonify() routes (the expense endpoints), so their output is unchanged.
+    """
+    if isinstance(obj, date):
+        return http_date(obj)
+    return encode_default(obj)
+
+
+def _stdlib_backend(default):
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=default)
+
+    def encode(obj):
+        return encoder.encode(obj).encode("utf-8")
+    return encode
+
+
+def _orjson_backend(default):
+    # Datetimes go through the default hook so both backends format them the same way
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def encode(obj):
+        return orjson.dumps(obj, default=default, option=options)
+    return encode
+
+
+_stdlib_encode = _stdlib_backend(encode_default)
+if orjson is not None:
+    _orjson_encode = _orjson_backend(encode_default)
+
+if JSON_ENCODER == "stdlib":
+    ENCODER_NAME = "stdlib"
+elif JSON_ENCODER in ("auto", "orjson"):
+    if orjson is not None:
+        ENCODER_NAME = "orjson"
+    elif JSON_ENCODER == "orjson":
+        raise ImportError("JSON_ENCODER=orjson but the orjson package is not installed")
+    else:
+        ENCODER_NAME = "stdlib"
+else:
+    raise ValueError(f"JSON_ENCODER must be one of auto, orjson, stdlib (got {JSON_ENCODER!r})")
+
+_backend = _orjson_backend if ENCODER_NAME == "orjson" else _stdlib_backend
+_encode = _orjson_encode if ENCODER_NAME == "orjson" else _stdlib_encode
+_encode_jsonify = _backend(jsonify_default)
+
+
+def _timed(encode, obj):
+    start = perf_counter()
+    try:
+        return encode(obj)
+    finally:
+        record_serialization_time(perf_counter() - start)
+
+
+def encode_json(obj):
+    """Serialize obj to compact UTF-8 JSON bytes."""
+    return _timed(_encode, obj)
+
+
+def dumps_json(obj):
+    """Like encode_json(), but returns str (for code that joins text pieces)."""
+    return encode_json(obj).decode("utf-8")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider so jsonify() uses the same backend as the Response(...)
+    routes. Compared with Flask's default it writes unescaped UTF-8 and keeps
+    keys in insertion order; Decimal stays a string and dates stay RFC 822
+    (jsonify_default), as before.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return _timed(_encode_jsonify, obj).decode("utf-8")
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(_timed(_encode_jsonify, obj), mimetype=self.mimetype)
@@ -0,0 +1,117 @@
+from functools import lru_cache
+
+# Number-to-Lao-words conversion.
+# The tables below are built once at import; a conversion is a handful of
+# divmod() calls and table lookups, and full results are memoized.
+
+UNITS = ["", "ໜຶ່ງ", "ສອງ", "ສາມ", "ສີ່", "ຫ້າ", "ຫົກ", "ເຈັດ", "ແປດ", "ເກົ້າ"]
+TEENS = ["ສິບ", "ສິບເອັດ", "ສິບສອງ", "ສິບສາມ", "ສິບສີ່", "ສິບຫ້າ", "ສິບຫົກ",
+         "ສິບເຈັດ", "ສິບແປດ", "ສິບເກົ້າ"]
+TENS = ["", "ສິບ", "ຊາວ", "ສາມສິບ", "ສີ່ສິບ", "ຫ້າສິບ", "ຫົກສິບ", "ເຈັດສິບ",
+        "ແປດສິບ", "ເກົ້າສິບ"]
+
+ZERO = "ສູນ"
+POINT = "ຈຸດ"
+HUNDRED = "ຮ້ອຍ"
+THOUSAND = "ພັນ"
+HUNDRED_THOUSAND = "ແສນ"
+MILLION = "ລ້ານ"
+BILLION = "ຕື້"
+
+MAX_NUMBER = 999_999_999_999
+OUT_OF_RANGE = "Number out of range"
+
+NUMBER_CACHE_SIZE = 65536
+FLOAT_CACHE_SIZE = 65536
+
+
+def _build_below_thousand():
+    """Words for 0..999, with 0 as "" so it can be used as an empty remainder."""
+    table = []
+    for number in range(1000):
+        if number < 10:
+            words = UNITS[number]
+        elif number < 20:
+            words = TEENS[number - 10]
+        elif number < 100:
+            ones = number % 10
+            if ones == 1:
+                words = TENS[number // 10] + "ເອັດ"
+            else:
+                words = TENS[number // 10] + UNITS[ones]
+        else:
+            words = UNITS[number // 100] + HUNDRED + table[number % 100]
+        table.append(words)
+    return table
+
+BELOW_THOUSAND = _build_below_thousand()
+
+# Decimal digits are read one by one, with 0 spelled out
+DIGITS = {str(digit): (BELOW_THOUSAND[digit] if digit else ZERO) for digit in range(10)}
+
+
+@lru_cache(maxsize=NUMBER_CACHE_SIZE)
+def number_to_words(number):
+    """Convert an integer between 0 and 999,999,999,999 to Lao words."""
+    if number == 0:
+        return ZERO
+    if number < 0:
+        # Kept for compatibility with the original recursive converter
+        return UNITS[number]
+    if number > MAX_NUMBER:
+        return OUT_OF_RANGE
+
+    parts = []
+    billions, number = divmod(number, 1_000_000_000)
+    if billions:
+        parts += (BELOW_THOUSAND[billions], BILLION)
+    millions, number = divmod(number, 1_000_000)
+    if millions:
+        parts += (BELOW_THOUSAND[millions], MILLION)
+    # 100,000 and up are read as "N hundred-thousand", not "N hundred thousand"
+    if number >= 100_000:
+        hundred_thousands, number = divmod(number, 100_000)
+        parts += (UNITS[hundred_thousands], HUNDRED_THOUSAND)
+    thousands, number = divmod(number, 1000)
+    if thousands:
+        parts += (BELOW_THOUSAND[thousands], THOUSAND)
+    parts.append(BELOW_THOUSAND[number])
+    return "".join(parts)
+
+
+def number_with_decimals_to_words(number):
+    """ Convert a number with up to two decimal places to words in Lao. """
+    integer_part = int(number)
+    decimal_part = round((number - integer_part) * 100)  # Extract two decimal places
+
+    words = number_to_words(integer_part)  # Convert integer part correctly
+
+    if decimal_part > 0:
+        decimal_digits = str(decimal_part).zfill(2)  # Ensure two digits
+        return words + POINT + "".join(DIGITS[digit] for digit in decimal_digits)
+    else:
+        return words
+
+
+@lru_cache(maxsize=FLOAT_CACHE_SIZE)
+def float_to_words(number_str):
+    """Convert a number string (up to two decimals are read) to Lao words."""
+    if '.' in number_str:
+        integer_part, decimal_part = number_str.split('.')
+        integer_words = number_to_words(int(integer_part))
+
+        decimal_part = decimal_part[:2].ljust(2, '0')  # Ensure two digits
+        decimal_words = POINT + "".join(DIGITS.get(digit) or number_to_words(int(digit)) for digit in decimal_part)
+
+        return integer_words + decimal_words
+    else:
+        return number_to_words(int(number_str))
+
+
+def cache_stats():
+    """Hit/miss counters of the memoized converters."""
+    stats = {}
+    for name, func in (("number_to_words", number_to_words), ("float_to_words", float_to_words)):
+        info = func.cache_info()
+        stats[name] = {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
+    return stats
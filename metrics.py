@@ -0,0 +1,235 @@
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+# Request metrics in Prometheus text format.
+#
+# MetricsMiddleware wraps the WSGI app and times each request until its body
+# has been sent (so streamed responses are measured in full). While a request
+# runs, time spent in database calls (query_stats.InstrumentedCursor) and in
+# JSON encoding (json_encoder) is added to per-thread accumulators; waitress
+# serves a request, body included, on a single thread. Recording a request is
+# a few dict lookups and additions under a lock.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+UNMATCHED_ROUTE = "unmatched"
+
+
+# --- Per-request DB / serialization timers ---
+class _RequestTimers(threading.local):
+    active = False
+    db = 0.0
+    serialization = 0.0
+
+_timers = _RequestTimers()
+
+
+def record_db_time(seconds):
+    """Add time spent in a database call to the current request."""
+    if _timers.active:
+        _timers.db += seconds
+
+
+def record_serialization_time(seconds):
+    """Add time spent encoding a response body to the current request."""
+    if _timers.active:
+        _timers.serialization += seconds
+
+
+# --- Metric types ---
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values=(), amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, label_values=(), amount=1):
+        self.inc(label_values, -amount)
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last one is +Inf)..., sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        index = bisect_left(self.buckets, value)  # first bucket with value <= le
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} histogram")
+        with self._lock:
+            items = sorted((label_values, list(series)) for label_values, series in self._series.items())
+        for label_values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                labels = _format_labels(self.labels, label_values, f'le="{_format_value(float(bound))}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+
+
+class MetricsRegistry:
+    """The request metrics plus collectors that report other components' stats at scrape time."""
+
+    def __init__(self):
+        self.requests = Counter("http_requests_total", "Requests by route, method and status code.",
+                                ("route", "method", "status"))
+        self.latency = Histogram("http_request_duration_seconds",
+                                 "Request latency until the response body was sent.", ("route", "method"))
+        self.db_time = Histogram("http_request_db_seconds",
+                                 "Time per request spent in database execute/fetch calls.", ("route", "method"))
+        self.serialization_time = Histogram("http_request_serialization_seconds",
+                                            "Time per request spent encoding JSON bodies.", ("route", "method"))
+        self.in_flight = Gauge("http_requests_in_flight", "Requests currently being handled, by route.", ("route",))
+        self._metrics = [self.requests, self.latency, self.db_time, self.serialization_time, self.in_flight]
+        self._collectors = []
+
+    def add_collector(self, collect):
+        """
+        Register collect(), called on every scrape. It returns (name, type, help,
+        samples) tuples, where samples is a list of (labels dict, value).
+        """
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            metric.render(lines)
+        for collect in self._collectors:
+            for name, kind, help_text, samples in collect():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# --- WSGI middleware ---
+class _ClosingBody:
+    """Response body wrapper that reports the request as finished when the server closes it."""
+
+    def __init__(self, body, on_close):
+        self._body = body
+        self._on_close = on_close
+
+    def __iter__(self):
+        return iter(self._body)
+
+    def close(self):
+        try:
+            close = getattr(self._body, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._on_close()
+
+
+class MetricsMiddleware:
+    """
+    Times each request and records it under its Flask route rule (e.g.
+    "/expense/retrieve"), so URLs with varying parts do not create new series.
+    """
+
+    ROUTE_KEY = "metrics.route"
+
+    def __init__(self, app, registry):
+        self.registry = registry
+        self.wsgi_app = app.wsgi_app
+        app.wsgi_app = self
+        app.before_request(self._resolve_route)
+
+    def _resolve_route(self):
+        from flask import request
+        rule = request.url_rule
+        route = rule.rule if rule is not None else UNMATCHED_ROUTE
+        request.environ[self.ROUTE_KEY] = route
+        self.registry.in_flight.inc((route,))
+
+    def __call__(self, environ, start_response):
+        start = perf_counter()
+        _timers.active = True
+        _timers.db = 0.0
+        _timers.serialization = 0.0
+        status = []
+
+        def capture_status(status_line, headers, exc_info=None):
+            status[:] = [status_line[:3]]
+            return start_response(status_line, headers, exc_info)
+
+        def finish():
+            elapsed = perf_counter() - start
+            db_seconds, serialization_seconds = _timers.db, _timers.serialization
+            _timers.active = False
+            route = environ.get(self.ROUTE_KEY)
+            if route is not None:
+                self.registry.in_flight.dec((route,))
+            else:
+                route = UNMATCHED_ROUTE
+            labels = (route, environ.get("REQUEST_METHOD", ""))
+            self.registry.requests.inc(labels + (status[0] if status else "500",))
+            self.registry.latency.observe(labels, elapsed)
+            self.registry.db_time.observe(labels, db_seconds)
+            self.registry.serialization_time.observe(labels, serialization_seconds)
+
+        try:
+            body = self.wsgi_app(environ, capture_status)
+        except BaseException:
+            finish()
+            raise
+        return _ClosingBody(body, finish)
+
+
+registry = MetricsRegistry()
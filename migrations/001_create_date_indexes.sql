@@ -0,0 +1,30 @@
+-- Supporting indexes for the create_date range searches
+-- (/searchByDate, /expense/searchByDate) and the /loadInvoices keyset pages.
+--
+-- The queries filter with a half-open range on the raw column
+--     WHERE create_date >= @start AND create_date < @end_plus_one_day
+-- with datetime parameters. SQL Server can answer that with an index seek only
+-- when create_date has a date type:
+--   - expense.create_date is datetime, so IX_expense_create_date seeks now.
+--   - TaxInv.create_date is still varchar. Comparing it with a datetime adds
+--     CONVERT_IMPLICIT on the column and the search keeps scanning until
+--     004_taxinv_datetime2.sql converts it (004 drops and recreates
+--     IX_TaxInv_create_date on the new column). Before that the index only
+--     serves the /loadInvoices keyset order.
+-- The leading create_date key gives the range seek and the ORDER BY
+-- create_date for free; order_no makes the key unique for the
+-- (create_date, order_no) keyset order.
+--
+-- Safe to run more than once.
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TaxInv_create_date' AND object_id = OBJECT_ID('dbo.TaxInv'))
+    CREATE NONCLUSTERED INDEX IX_TaxInv_create_date
+        ON dbo.TaxInv (create_date, order_no)
+        INCLUDE (inv_no, status, order_type, fail_reason, update_date);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_expense_create_date' AND object_id = OBJECT_ID('dbo.expense'))
+    CREATE NONCLUSTERED INDEX IX_expense_create_date
+        ON dbo.expense (create_date)
+        INCLUDE (exp_no, status, fail_reason, update_date);
+GO
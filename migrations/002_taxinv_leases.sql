@@ -0,0 +1,22 @@
+-- Lease columns for the /retrieveInvoices claim mode (Data.CLAIM).
+--
+-- A poller claims waiting orders by setting lease_owner/lease_expires_at in a
+-- single UPDATE ... OUTPUT with READPAST. Orders whose lease has expired (the
+-- worker died before calling /updateInvoiceStatus) become claimable again.
+--
+-- Safe to run more than once.
+
+IF COL_LENGTH('dbo.TaxInv', 'lease_owner') IS NULL
+    ALTER TABLE dbo.TaxInv ADD lease_owner varchar(64) NULL;
+GO
+
+IF COL_LENGTH('dbo.TaxInv', 'lease_expires_at') IS NULL
+    ALTER TABLE dbo.TaxInv ADD lease_expires_at datetime NULL;
+GO
+
+-- Finds the oldest claimable waiting orders without scanning finished ones
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TaxInv_status_lease' AND object_id = OBJECT_ID('dbo.TaxInv'))
+    CREATE NONCLUSTERED INDEX IX_TaxInv_status_lease
+        ON dbo.TaxInv (status, create_date, order_no)
+        INCLUDE (lease_expires_at, lease_owner, fail_reason, order_type);
+GO
@@ -0,0 +1,18 @@
+-- Change tracking column for the /watchInvoices long-poll feed.
+--
+-- SQL Server bumps a rowversion on every INSERT/UPDATE of the row, so
+-- "row_ver > @high_water" finds every order written since the client's last
+-- call. That includes lease-only claim updates, so the feed itself now reads
+-- 005_taxinv_change_log.sql; row_ver remains the version of the ETag listings.
+--
+-- Safe to run more than once.
+
+IF COL_LENGTH('dbo.TaxInv', 'row_ver') IS NULL
+    ALTER TABLE dbo.TaxInv ADD row_ver rowversion;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TaxInv_row_ver' AND object_id = OBJECT_ID('dbo.TaxInv'))
+    CREATE NONCLUSTERED INDEX IX_TaxInv_row_ver
+        ON dbo.TaxInv (row_ver)
+        INCLUDE (order_no, status, fail_reason, order_type);
+GO
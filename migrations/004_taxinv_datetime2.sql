@@ -0,0 +1,144 @@
+-- Convert TaxInv.create_date / update_date from varchar to datetime2(3).
+--
+-- The columns hold text in SQL Server's default style ("Jan  2 2025  3:04PM"),
+-- so every range search converts the column per row and every response parses
+-- the text again in Python. As datetime2 they compare natively (the
+-- create_date indexes from 001/002 become seekable for the typed parameters)
+-- and pyodbc returns datetime objects.
+--
+-- The API formats both shapes (datetime_format.format_db_datetime), so it can
+-- keep running before, during and after the migration:
+--   1. add shadow columns create_date_new / update_date_new
+--   2. backfill them in batches (re-runnable; only touches unconverted rows)
+--   3. in one transaction: re-sync rows written or updated meanwhile, refuse to continue
+--      if any value did not convert, drop the dependent indexes, swap the
+--      columns and recreate the indexes
+--
+-- Values only have minute precision; the seconds of migrated rows are 00.
+-- Other site-specific indexes or constraints on these columns must be dropped
+-- before step 3 (it stops with an error otherwise) and recreated afterwards.
+--
+-- Safe to run more than once: columns that already have a date type are skipped.
+
+-- 1. Shadow columns
+IF TYPE_NAME((SELECT system_type_id FROM sys.columns WHERE object_id = OBJECT_ID('dbo.TaxInv') AND name = 'create_date'))
+       IN ('varchar', 'nvarchar', 'char', 'nchar')
+   AND COL_LENGTH('dbo.TaxInv', 'create_date_new') IS NULL
+    ALTER TABLE dbo.TaxInv ADD create_date_new datetime2(3) NULL;
+GO
+
+IF TYPE_NAME((SELECT system_type_id FROM sys.columns WHERE object_id = OBJECT_ID('dbo.TaxInv') AND name = 'update_date'))
+       IN ('varchar', 'nvarchar', 'char', 'nchar')
+   AND COL_LENGTH('dbo.TaxInv', 'update_date_new') IS NULL
+    ALTER TABLE dbo.TaxInv ADD update_date_new datetime2(3) NULL;
+GO
+
+-- 2. Batched backfill (dynamic SQL: the shadow columns may not exist at compile time)
+DECLARE @column sysname, @sql nvarchar(max), @rows int;
+DECLARE columns_to_convert CURSOR LOCAL FAST_FORWARD FOR
+    SELECT name FROM (VALUES ('create_date'), ('update_date')) AS c (name)
+    WHERE COL_LENGTH('dbo.TaxInv', name + '_new') IS NOT NULL;
+OPEN columns_to_convert;
+FETCH NEXT FROM columns_to_convert INTO @column;
+WHILE @@FETCH_STATUS = 0
+BEGIN
+    SET @sql = N'UPDATE TOP (50000) dbo.TaxInv
+                    SET ' + QUOTENAME(@column + '_new') + N' = TRY_CONVERT(datetime2(3), ' + QUOTENAME(@column) + N', 100)
+                  WHERE ' + QUOTENAME(@column + '_new') + N' IS NULL
+                    AND TRY_CONVERT(datetime2(3), ' + QUOTENAME(@column) + N', 100) IS NOT NULL';
+    SET @rows = 1;
+    WHILE @rows > 0
+    BEGIN
+        EXEC sp_executesql @sql;
+        SET @rows = @@ROWCOUNT;
+    END
+    FETCH NEXT FROM columns_to_convert INTO @column;
+END
+CLOSE columns_to_convert;
+DEALLOCATE columns_to_convert;
+GO
+
+-- 3. Swap
+IF COL_LENGTH('dbo.TaxInv', 'create_date_new') IS NOT NULL OR COL_LENGTH('dbo.TaxInv', 'update_date_new') IS NOT NULL
+BEGIN
+    SET XACT_ABORT ON;
+    BEGIN TRANSACTION;
+
+    -- Block writers until the swap is done
+    DECLARE @lock int = (SELECT COUNT(*) FROM dbo.TaxInv WITH (TABLOCKX, HOLDLOCK));
+
+    DECLARE @column sysname, @sql nvarchar(max), @bad int, @constraint sysname;
+    DECLARE columns_to_swap CURSOR LOCAL STATIC FOR
+        SELECT name FROM (VALUES ('create_date'), ('update_date')) AS c (name)
+        WHERE COL_LENGTH('dbo.TaxInv', name + '_new') IS NOT NULL;
+
+    -- Catch up and verify every column before changing anything. Re-sync every
+    -- row whose shadow value differs from the converted text, not only the ones
+    -- never backfilled: update_date moves on status updates, cancels and lease
+    -- claims after step 2 (EXCEPT compares NULLs as equal)
+    OPEN columns_to_swap;
+    FETCH NEXT FROM columns_to_swap INTO @column;
+    WHILE @@FETCH_STATUS = 0
+    BEGIN
+        SET @sql = N'UPDATE dbo.TaxInv
+                        SET ' + QUOTENAME(@column + '_new') + N' = TRY_CONVERT(datetime2(3), ' + QUOTENAME(@column) + N', 100)
+                      WHERE EXISTS (SELECT ' + QUOTENAME(@column + '_new') + N'
+                                    EXCEPT
+                                    SELECT TRY_CONVERT(datetime2(3), ' + QUOTENAME(@column) + N', 100));
+                     SELECT @bad = COUNT(*) FROM dbo.TaxInv
+                      WHERE ' + QUOTENAME(@column + '_new') + N' IS NULL AND ' + QUOTENAME(@column) + N' IS NOT NULL';
+        EXEC sp_executesql @sql, N'@bad int OUTPUT', @bad = @bad OUTPUT;
+        IF @bad > 0
+        BEGIN
+            SET @sql = CONCAT(N'TaxInv.', @column, N' has ', @bad, N' value(s) that are not dates; fix them and re-run.');
+            THROW 50004, @sql, 1;
+        END
+        FETCH NEXT FROM columns_to_swap INTO @column;
+    END
+
+    IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TaxInv_create_date' AND object_id = OBJECT_ID('dbo.TaxInv'))
+        DROP INDEX IX_TaxInv_create_date ON dbo.TaxInv;
+    IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TaxInv_status_lease' AND object_id = OBJECT_ID('dbo.TaxInv'))
+        DROP INDEX IX_TaxInv_status_lease ON dbo.TaxInv;
+
+    FETCH FIRST FROM columns_to_swap INTO @column;
+    WHILE @@FETCH_STATUS = 0
+    BEGIN
+        -- Default constraints on the old column would block DROP COLUMN
+        SET @constraint = (SELECT dc.name FROM sys.default_constraints AS dc
+                           JOIN sys.columns AS c ON c.object_id = dc.parent_object_id AND c.column_id = dc.parent_column_id
+                           WHERE dc.parent_object_id = OBJECT_ID('dbo.TaxInv') AND c.name = @column);
+        IF @constraint IS NOT NULL
+        BEGIN
+            SET @sql = N'ALTER TABLE dbo.TaxInv DROP CONSTRAINT ' + QUOTENAME(@constraint);
+            EXEC sp_executesql @sql;
+            SET @sql = N'ALTER TABLE dbo.TaxInv ADD CONSTRAINT ' + QUOTENAME(@constraint)
+                     + N' DEFAULT SYSDATETIME() FOR ' + QUOTENAME(@column + '_new');
+            EXEC sp_executesql @sql;
+        END
+
+        SET @sql = N'ALTER TABLE dbo.TaxInv DROP COLUMN ' + QUOTENAME(@column);
+        EXEC sp_executesql @sql;
+        SET @sql = N'dbo.TaxInv.' + @column + N'_new';
+        EXEC sp_rename @sql, @column, 'COLUMN';
+        FETCH NEXT FROM columns_to_swap INTO @column;
+    END
+    CLOSE columns_to_swap;
+    DEALLOCATE columns_to_swap;
+
+    COMMIT TRANSACTION;
+END
+GO
+
+-- Recreate the indexes from 001/002 on the converted columns
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TaxInv_create_date' AND object_id = OBJECT_ID('dbo.TaxInv'))
+    CREATE NONCLUSTERED INDEX IX_TaxInv_create_date
+        ON dbo.TaxInv (create_date, order_no)
+        INCLUDE (inv_no, status, order_type, fail_reason, update_date);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TaxInv_status_lease' AND object_id = OBJECT_ID('dbo.TaxInv'))
+    CREATE NONCLUSTERED INDEX IX_TaxInv_status_lease
+        ON dbo.TaxInv (status, create_date, order_no)
+        INCLUDE (lease_expires_at, lease_owner, fail_reason, order_type);
+GO
@@ -0,0 +1,55 @@
+-- Change log for the /watchInvoices long-poll feed.
+--
+-- TaxInv.row_ver (003) moves on every write to the row, including the lease
+-- claims of /retrieveInvoices claim mode, which only set lease_owner /
+-- lease_expires_at. Keyed on row_ver, the feed re-sent every claimed order as
+-- a "change".
+--
+-- TaxInvChange keeps one row per order whose change_ver moves only when the
+-- order is inserted or its status, order_type, fail_reason or inv_no change.
+-- A trigger maintains it, so every writer is covered (this API, other
+-- processes) and lease-only updates are skipped. rowversion values come from
+-- one database-wide counter, so HIGH_WATER marks issued from row_ver stay
+-- valid and MIN_ACTIVE_ROWVERSION() still holds back uncommitted changes.
+--
+-- Safe to run more than once.
+
+IF OBJECT_ID('dbo.TaxInvChange', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.TaxInvChange (
+        order_no    varchar(50) NOT NULL CONSTRAINT PK_TaxInvChange PRIMARY KEY,
+        change_ver  rowversion  NOT NULL
+    );
+    CREATE NONCLUSTERED INDEX IX_TaxInvChange_change_ver ON dbo.TaxInvChange (change_ver);
+
+    -- Seed the orders that are waiting now so a client starting from SINCE = 0 sees them
+    INSERT INTO dbo.TaxInvChange (order_no)
+    SELECT order_no FROM dbo.TaxInv WHERE status = 'wait';
+END
+GO
+
+CREATE OR ALTER TRIGGER dbo.TR_TaxInv_change_log
+ON dbo.TaxInv
+AFTER INSERT, UPDATE
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    -- New rows, and updated rows whose feed columns differ (EXCEPT treats NULLs as equal)
+    WITH changed AS (
+        SELECT i.order_no
+        FROM inserted AS i
+        LEFT JOIN deleted AS d ON d.order_no = i.order_no
+        WHERE d.order_no IS NULL
+           OR EXISTS (SELECT i.status, i.order_type, i.fail_reason, i.inv_no
+                      EXCEPT
+                      SELECT d.status, d.order_type, d.fail_reason, d.inv_no)
+    )
+    MERGE dbo.TaxInvChange AS target
+    USING changed AS source ON target.order_no = source.order_no
+    WHEN MATCHED THEN
+        UPDATE SET order_no = source.order_no  -- any update bumps change_ver
+    WHEN NOT MATCHED THEN
+        INSERT (order_no) VALUES (source.order_no);
+END
+GO
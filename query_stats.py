@@ -0,0 +1,244 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import deque
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from time import perf_counter
+
+from metrics import record_db_time
+
+# Per-statement query statistics and the slow-query log.
+#
+# InstrumentedCursor wraps every cursor handed out by get_db_connection().
+# Each execute is timed and filed under the fingerprint of its SQL text
+# (literals and IN/VALUES lists collapsed, whitespace normalised), together
+# with the fetch time that follows it on the same cursor. Statements slower
+# than SLOW_QUERY_THRESHOLD_MS are logged with the shape of their parameters,
+# never their values.
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "500"))
+QUERY_STATS_SAMPLES = int(os.getenv("QUERY_STATS_SAMPLES", "512"))
+QUERY_STATS_MAX_FINGERPRINTS = int(os.getenv("QUERY_STATS_MAX_FINGERPRINTS", "500"))
+
+OVERFLOW_FINGERPRINT = "(other statements)"
+
+logger = logging.getLogger("slow_query")
+
+
+# --- Fingerprinting ---
+_STRING_LITERAL = re.compile(r"N?'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w@#$.])-?\d+(?:\.\d+)?(?![\w.])")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*")
+_WHITESPACE = re.compile(r"\s+")
+_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """
+    Normalise a statement so that executions differing only in literals, the
+    length of IN (?, ?, ...) / VALUES (?, ?), (?, ?) lists or whitespace
+    share one fingerprint.
+    """
+    text = _COMMENT.sub(" ", sql)
+    text = _STRING_LITERAL.sub("?", text)
+    text = _NUMBER_LITERAL.sub("?", text)
+    text = _PLACEHOLDER_LIST.sub("(...)", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def fingerprint_id(text):
+    """Short stable id for a fingerprint (used as the /metrics label)."""
+    return hashlib.md5(text.encode("utf-8")).hexdigest()[:12]
+
+
+def _value_shape(value):
+    if value is None:
+        return "None"
+    if isinstance(value, (str, bytes, bytearray)):
+        return f"{type(value).__name__}({len(value)})"
+    if isinstance(value, (bool, int, float, Decimal, datetime, date)):
+        return type(value).__name__
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def parameter_shape(params, many=False):
+    """Describe parameters by type and length only, e.g. "(str(12), int, None)"."""
+    if many:
+        rows = params if isinstance(params, (list, tuple)) else list(params)
+        first = parameter_shape(rows[0]) if rows else "()"
+        return f"{len(rows)} x {first}"
+    if len(params) == 1 and isinstance(params[0], (list, tuple)):
+        params = params[0]  # execute(sql, (a, b)) and execute(sql, a, b) are the same call
+    return "(" + ", ".join(_value_shape(value) for value in params) + ")"
+
+
+# --- Aggregation ---
+class _StatementStats:
+    __slots__ = ("sql", "count", "errors", "execute_seconds", "fetch_seconds", "fetches", "max_seconds", "samples")
+
+    def __init__(self, sql, sample_size):
+        self.sql = sql
+        self.count = 0
+        self.errors = 0
+        self.execute_seconds = 0.0
+        self.fetch_seconds = 0.0
+        self.fetches = 0
+        self.max_seconds = 0.0
+        self.samples = deque(maxlen=sample_size)
+
+
+def _percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return None
+    index = min(len(sorted_samples) - 1, int(round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+class QueryStats:
+    """
+    Counts and execute-time percentiles per statement fingerprint. Percentiles
+    come from the most recent `sample_size` executions of each statement.
+    """
+
+    def __init__(self, sample_size=512, max_fingerprints=500, slow_threshold_ms=500):
+        self.sample_size = sample_size
+        self.max_fingerprints = max_fingerprints
+        self.slow_threshold = slow_threshold_ms / 1000.0
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._slow = 0
+
+    def _get_locked(self, key):
+        stats = self._statements.get(key)
+        if stats is None:
+            if len(self._statements) >= self.max_fingerprints:
+                key = OVERFLOW_FINGERPRINT
+                stats = self._statements.get(key)
+            if stats is None:
+                stats = self._statements[key] = _StatementStats(key, self.sample_size)
+        return stats
+
+    def record_execute(self, key, seconds, failed=False):
+        with self._lock:
+            stats = self._get_locked(key)
+            stats.count += 1
+            stats.execute_seconds += seconds
+            stats.samples.append(seconds)
+            if seconds > stats.max_seconds:
+                stats.max_seconds = seconds
+            if failed:
+                stats.errors += 1
+            if seconds >= self.slow_threshold:
+                self._slow += 1
+
+    def record_fetch(self, key, seconds):
+        with self._lock:
+            stats = self._get_locked(key)
+            stats.fetches += 1
+            stats.fetch_seconds += seconds
+
+    def snapshot(self):
+        """Per-fingerprint stats, slowest p99 first."""
+        with self._lock:
+            items = [(stats, sorted(stats.samples)) for stats in self._statements.values()]
+            slow = self._slow
+        statements = []
+        for stats, samples in items:
+            statements.append({
+                "id": fingerprint_id(stats.sql),
+                "sql": stats.sql,
+                "count": stats.count,
+                "errors": stats.errors,
+                "execute_seconds": round(stats.execute_seconds, 6),
+                "fetch_seconds": round(stats.fetch_seconds, 6),
+                "fetches": stats.fetches,
+                "p50_seconds": _percentile(samples, 0.50),
+                "p99_seconds": _percentile(samples, 0.99),
+                "max_seconds": stats.max_seconds,
+            })
+        statements.sort(key=lambda item: item["p99_seconds"] or 0, reverse=True)
+        return {"slow_threshold_ms": self.slow_threshold * 1000, "slow_statements": slow, "statements": statements}
+
+
+query_stats = QueryStats(sample_size=QUERY_STATS_SAMPLES, max_fingerprints=QUERY_STATS_MAX_FINGERPRINTS,
+                         slow_threshold_ms=SLOW_QUERY_THRESHOLD_MS)
+
+
+def _log_slow(operation, key, seconds, shape):
+    logger.warning("slow query: %.1f ms %s %s params=%s", seconds * 1000, operation, key, shape)
+
+
+# --- Cursor wrapper ---
+class InstrumentedCursor:
+    """
+    pyodbc cursor proxy. Times every execute/fetch call, adds it to the
+    request's DB time (/metrics) and to the statement's QueryStats entry, and
+    logs calls slower than the threshold.
+    """
+
+    __slots__ = ("_cursor", "_fingerprint")
+
+    def __init__(self, cursor):
+        object.__setattr__(self, "_cursor", cursor)
+        object.__setattr__(self, "_fingerprint", None)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        # e.g. cursor.fast_executemany = True
+        setattr(self._cursor, name, value)
+
+    def _execute(self, method, sql, params, many):
+        key = fingerprint(sql)
+        object.__setattr__(self, "_fingerprint", key)
+        failed = True
+        start = perf_counter()
+        try:
+            method(sql, *params)
+            failed = False
+        finally:
+            seconds = perf_counter() - start
+            record_db_time(seconds)
+            query_stats.record_execute(key, seconds, failed)
+            if seconds >= query_stats.slow_threshold:
+                shape = parameter_shape(params[0], many=True) if many else parameter_shape(params)
+                _log_slow("executemany" if many else "execute", key, seconds, shape)
+        return self  # pyodbc returns the cursor, so cursor.execute(...).fetchone() chains
+
+    def execute(self, sql, *params):
+        return self._execute(self._cursor.execute, sql, params, False)
+
+    def executemany(self, sql, params):
+        return self._execute(self._cursor.executemany, sql, (params,), True)
+
+    def _fetch(self, method, *args):
+        start = perf_counter()
+        try:
+            return method(*args)
+        finally:
+            seconds = perf_counter() - start
+            record_db_time(seconds)
+            key = self._fingerprint
+            if key is not None:
+                query_stats.record_fetch(key, seconds)
+                if seconds >= query_stats.slow_threshold:
+                    _log_slow(method.__name__, key, seconds, "-")
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def fetchmany(self, *args):
+        return self._fetch(self._cursor.fetchmany, *args)
+
+    def nextset(self):
+        return self._fetch(self._cursor.nextset)
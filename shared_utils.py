@@ -1,7 +1,12 @@
-from flask import request, jsonify
+from flask import request, jsonify, Response
 import pyodbc
 import os
+import threading
 import hashlib
+from datetime import datetime, timedelta
+from db_pool import ConnectionPool
+from json_encoder import dumps_json, ENCODER_NAME
+from query_stats import InstrumentedCursor
 
 # --- Authentication ---
 stored_token = os.getenv("API_TOKEN")
@@ -44,8 +49,16 @@ DB_USER = os.getenv("DB_USER", "APIS_TEST")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "apis@2025")
 DB_NAME = os.getenv("DB_NAME", "TaxAPI")
 
-def get_db_connection():
-    """Establish a connection to the MSSQL database."""
+# Connection pool settings
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_IDLE_TIMEOUT = float(os.getenv("DB_POOL_IDLE_TIMEOUT", "300"))      # seconds
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))     # seconds
+DB_POOL_CHECKOUT_TIMEOUT = float(os.getenv("DB_POOL_CHECKOUT_TIMEOUT", "30"))  # seconds
+DB_POOL_PING_INTERVAL = float(os.getenv("DB_POOL_PING_INTERVAL", "5"))      # seconds
+
+def _open_db_connection():
+    """Open a brand-new connection to the MSSQL database."""
     connection_string = (
         f"DRIVER={{ODBC Driver 17 for SQL Server}};"
         f"SERVER={DB_HOST},{DB_PORT};"
@@ -55,6 +68,64 @@ def get_db_connection():
     )
     return pyodbc.connect(connection_string)
 
+db_pool = ConnectionPool(
+    _open_db_connection,
+    min_size=DB_POOL_MIN_SIZE,
+    max_size=DB_POOL_MAX_SIZE,
+    idle_timeout=DB_POOL_IDLE_TIMEOUT,
+    max_lifetime=DB_POOL_MAX_LIFETIME,
+    checkout_timeout=DB_POOL_CHECKOUT_TIMEOUT,
+    ping_interval=DB_POOL_PING_INTERVAL,
+    cursor_wrapper=InstrumentedCursor,  # DB time for /metrics, per-statement stats, slow-query log
+)
+
+def _warm_db_pool():
+    try:
+        db_pool.warm()
+    except Exception as e:
+        # Not fatal: the pool opens connections on demand as well
+        print(f"Could not pre-open {DB_POOL_MIN_SIZE} database connection(s): {e}")
+
+# Open the DB_POOL_MIN_SIZE warm connections without holding up startup
+threading.Thread(target=_warm_db_pool, name="db-pool-warm", daemon=True).start()
+
+def get_db_connection():
+    """
+    Check out a connection to the MSSQL database from the shared pool.
+    Calling close() on it returns it to the pool (rolling back anything uncommitted).
+    """
+    return db_pool.get()
+
+def get_pool_stats():
+    """Return the connection pool gauges and counters."""
+    return db_pool.stats()
+
+def execute_many(cursor, query, rows):
+    """
+    Run one parameterized statement for every row in `rows` using pyodbc's
+    fast_executemany, so the whole batch goes to the server in one round trip.
+    """
+    if not rows:
+        return
+    cursor.fast_executemany = True
+    try:
+        cursor.executemany(query, rows)
+    finally:
+        cursor.fast_executemany = False
+
+def date_range_bounds(start_date, end_date):
+    """
+    Turn an inclusive 'YYYY-MM-DD' start/end pair into a half-open datetime range
+    [start, end + 1 day) so queries can compare the raw create_date column
+    (`create_date >= ? AND create_date < ?`). That only becomes an index seek
+    when the column has a date type: TaxInv.create_date is varchar until
+    migrations/004_taxinv_datetime2.sql runs, and until then SQL Server converts
+    the column per row and still scans. Raises ValueError for malformed dates.
+    """
+    start = datetime.strptime(start_date.strip(), "%Y-%m-%d")
+    end = datetime.strptime(end_date.strip(), "%Y-%m-%d") + timedelta(days=1)
+    return start, end
+
 # --- Signature and Other Helpers ---
 def string_sort(value):
     """Sort the characters in a string."""
@@ -81,4 +152,90 @@ def clean_string(value):
     """
     if isinstance(value, str):
         return value.strip()
-    return value
\ No newline at end of file
+    return value
+
+
+# --- Streaming JSON responses ---
+STREAM_FETCH_SIZE = int(os.getenv("STREAM_FETCH_SIZE", "500"))
+
+def stream_requested():
+    """True when the caller asked for a streamed response with ?stream=1."""
+    return request.args.get("stream", "").lower() in ("1", "true", "yes")
+
+def iter_cursor_rows(cursor, first_batch):
+    """Yield the rows of first_batch, then keep pulling from cursor with fetchmany()."""
+    batch = first_batch
+    while batch:
+        yield from batch
+        batch = cursor.fetchmany(STREAM_FETCH_SIZE)
+
+def stream_json_response(conn, items, envelope=None, dumps=None, status=200):
+    """
+    Stream `items` as a JSON array without building the whole document in memory.
+
+    The body is the same text as dumps(list(items)), or, when envelope is given,
+    dumps({**envelope, "data": list(items)}). The response takes ownership of
+    conn and closes it once the body has been sent (or the client went away),
+    so the caller must not close it.
+    """
+    if dumps is None:
+        dumps = dumps_json
+    separator = dumps([0, 0])[2:-2]  # "," for the compact encoder, ", " for json.dumps defaults
+
+    if envelope is None:
+        prefix, suffix = "[", "]"
+    else:
+        text = dumps({**envelope, "data": []})
+        split_at = text.index("[]", text.index('"data"')) + 1
+        prefix, suffix = text[:split_at], text[split_at:]
+
+    def generate():
+        try:
+            yield prefix
+            lead = ""
+            chunk = []
+            for item in items:
+                chunk.append(dumps(item))
+                if len(chunk) >= STREAM_FETCH_SIZE:
+                    yield lead + separator.join(chunk)
+                    lead = separator
+                    chunk = []
+            if chunk:
+                yield lead + separator.join(chunk)
+            yield suffix
+        finally:
+            conn.close()
+
+    response = Response(generate(), content_type="application/json; charset=utf-8", status=status)
+    # A generator that never started skips its finally block when closed (HEAD
+    # request, client gone before the first chunk), so also release on close
+    response.call_on_close(conn.close)
+    return response
+
+
+# --- Conditional GET (ETag / If-None-Match) ---
+def result_set_etag(cursor, version_query, params, *variant):
+    """
+    Run version_query, a cheap aggregate over the rows a listing would return
+    (row count plus MAX(row_ver) or a checksum), and derive an ETag from its
+    result and `variant` (whatever else shapes the body, e.g. the filters).
+    Returns (etag, version_row) so the caller can look at the row count
+    before fetching anything.
+
+    The ETag is weak: compression changes the bytes on the wire but not the
+    content, and the body is only compared semantically by the client.
+    """
+    cursor.execute(version_query, params)
+    version = cursor.fetchone()
+    key = repr((tuple(version), variant, ENCODER_NAME))
+    return hashlib.md5(key.encode("utf-8")).hexdigest(), version
+
+def etag_matches(etag):
+    """True when the request's If-None-Match already names this ETag."""
+    return request.if_none_match.contains_weak(etag)
+
+def not_modified_response(etag):
+    """Empty 304 reply for a client whose cached copy is still current."""
+    response = Response(status=304)
+    response.set_etag(etag, weak=True)
+    return response
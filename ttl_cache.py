@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache whose entries also expire after `ttl`
+    seconds. It is bounded both by entry count and by the approximate size of
+    the cached values (`sizeof(value)` bytes, measured once on put()).
+
+    To avoid caching a value that was read before a concurrent write, read the
+    `generation` before querying and pass it to put(): any invalidate() in
+    between makes the put() a no-op.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=4 * 1024 * 1024, ttl=300, sizeof=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof or (lambda value: len(repr(value)))
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, expires_at, size), least recently used first
+        self._bytes = 0
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    @property
+    def generation(self):
+        with self._lock:
+            return self._generation
+
+    def get(self, key):
+        """Return the cached value, or None on a miss (or when it has expired)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return entry[0]
+                self._remove_locked(key)
+                self._expirations += 1
+            self._misses += 1
+            return None
+
+    def put(self, key, value, generation=None):
+        """Cache value under key, unless an invalidation happened since `generation` was read."""
+        size = self._sizeof(value)
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if key in self._entries:
+                self._remove_locked(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove_locked(next(iter(self._entries)))
+                self._evictions += 1
+
+    def invalidate(self, *keys):
+        """Drop keys (they may or may not be cached) and fence off in-flight put() calls."""
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                if key in self._entries:
+                    self._remove_locked(key)
+                    self._invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove_locked(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "size": len(self._entries),
+                "max_size": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "invalidations": self._invalidations,
+            }